@@ -0,0 +1,10 @@
+from flaskr.asgi import create_async_app
+
+"""
+Async entry point
+    uvicorn asgi:app --workers 4
+
+Serves the same routes and JSON as wsgi.py from an ASGI server, see
+flaskr/asgi.py.
+"""
+app = create_async_app()
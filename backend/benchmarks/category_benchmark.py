@@ -0,0 +1,113 @@
+import os
+import statistics
+import sys
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flaskr.quiz import id_range, id_at_or_after, id_before
+
+"""
+Category benchmark
+    EXPLAIN ANALYZE of the by-category and quiz queries before and after
+    migration 0004. "before" is the table db.create_all built from
+    the old model: a varchar category and no index on it. "after" has the
+    integer column and the (category, id) and (category, difficulty)
+    indexes. The quiz rows time the statements flaskr/quiz.py builds: the
+    id range read once per /quizzes, then the probe for the first id at or
+    after a random one and the read of the id before it, repeated for each
+    sampling attempt. A scratch `questions` table in the benchmark_category
+    schema is filled to each size by cycling through the rows of
+    `questions`, so load trivia.psql into the target database first.
+
+    python benchmarks/category_benchmark.py [database_url]
+"""
+SIZES = (10000, 100000, 1000000)
+REPEAT = 5
+SCHEMA = 'benchmark_category'
+CATEGORY = 3
+PIVOT = 5000
+QUERIES = (
+    ('by category', lambda category: text(
+        "SELECT * FROM questions WHERE category = :category").bindparams(category=category)),
+    ('cursor page', lambda category: text(
+        "SELECT * FROM questions WHERE category = :category AND id > :after "
+        "ORDER BY id LIMIT 11").bindparams(category=category, after=PIVOT)),
+    ('count', lambda category: text(
+        "SELECT count(*) FROM questions WHERE category = :category").bindparams(category=category)),
+    ('quiz id range', lambda category: id_range(category)),
+    ('quiz probe', lambda category: id_at_or_after(category, PIVOT)),
+    ('quiz previous', lambda category: id_before(category, PIVOT)),
+)
+# the queries whose whole plan is printed for the largest size
+SHOWN = ('by category', 'quiz probe')
+
+def fill(engine, size, category_type):
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        connection.execute(text(
+            f"CREATE TABLE {SCHEMA}.questions (id serial PRIMARY KEY, question text, "
+            f"answer text, difficulty integer, category {category_type})"))
+        connection.execute(text(f"""
+            INSERT INTO {SCHEMA}.questions (question, answer, difficulty, category)
+            SELECT seed.question || ' #' || g, seed.answer, seed.difficulty, seed.category
+            FROM generate_series(1, :size) AS g
+            JOIN (SELECT row_number() OVER (ORDER BY id) - 1 AS n, question, answer,
+                         difficulty, category
+                  FROM public.questions) AS seed
+              ON seed.n = g % (SELECT count(*) FROM public.questions)
+        """), {'size': size})
+        connection.execute(text(f"ANALYZE {SCHEMA}.questions"))
+
+def add_category_indexes(engine):
+    with engine.begin() as connection:
+        connection.execute(text(f"CREATE INDEX questions_category_id ON {SCHEMA}.questions (category, id)"))
+        connection.execute(text(
+            f"CREATE INDEX questions_category_difficulty ON {SCHEMA}.questions (category, difficulty)"))
+        connection.execute(text(f"ANALYZE {SCHEMA}.questions"))
+
+def explain(connection, statement, options):
+    compiled = statement.compile(dialect=connection.dialect)
+    return connection.execute(f"EXPLAIN ({options}) {compiled}", compiled.params)
+
+def measure(engine, statement):
+    timings = []
+    with engine.connect() as connection:
+        # the unqualified `questions` of the statements is the scratch table
+        connection.execute(text(f"SET search_path TO {SCHEMA}, public"))
+        for _ in range(REPEAT):
+            plan = explain(connection, statement, 'ANALYZE, FORMAT JSON').scalar()
+            timings.append(plan[0]['Execution Time'])
+        shown = explain(connection, statement, 'ANALYZE').fetchall()
+    return statistics.median(timings), plan[0]['Plan']['Node Type'], [row[0] for row in shown]
+
+def measure_all(engine, category):
+    return {name: measure(engine, build(category)) for name, build in QUERIES}
+
+def run(database_url):
+    engine = create_engine(database_url)
+    print(f"{'rows':>9} {'query':<14} {'before ms':>10} {'after ms':>9}  plan before -> after")
+    try:
+        for size in SIZES:
+            # the old model bound the id as a string against a varchar column
+            fill(engine, size, 'varchar')
+            before = measure_all(engine, str(CATEGORY))
+            fill(engine, size, 'integer')
+            add_category_indexes(engine)
+            after = measure_all(engine, CATEGORY)
+            for name, _ in QUERIES:
+                print(f"{size:>9} {name:<14} {before[name][0]:>10.2f} {after[name][0]:>9.2f}  "
+                      f"{before[name][1]} -> {after[name][1]}")
+        for name in SHOWN:
+            for label, plans in (('before', before), ('after', after)):
+                print(f"\n{name}, {label}, {SIZES[-1]} rows")
+                print('\n'.join(plans[name][2]))
+    finally:
+        with engine.begin() as connection:
+            connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+
+if __name__ == "__main__":
+    load_dotenv()
+    run(sys.argv[1] if len(sys.argv) > 1 else os.getenv('database_path'))
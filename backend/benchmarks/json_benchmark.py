@@ -0,0 +1,73 @@
+import os
+import statistics
+import sys
+import time
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flaskr import create_app
+from flaskr.json_encoding import orjson, orjson_dumps, stdlib_dumps
+
+"""
+JSON encoder benchmark
+    times the encoding of question lists shaped like the GET /questions and
+    search responses with each encoder, then the whole GET /questions and
+    search requests through the Flask test client with JSON_ENCODER set to
+    'stdlib' and to 'orjson'. Needs orjson installed and a migrated database
+    with the trivia.psql data.
+
+    python benchmarks/json_benchmark.py [database_url]
+"""
+SIZES = (10, 100, 1000, 10000)
+REPEAT = 200
+REQUESTS = (
+    ('GET /questions', 'get', '/questions?page=1', None),
+    ('search 100', 'post', '/questions', {'searchTerm': 'e', 'limit': 100}),
+)
+
+def payload(size):
+    return {
+        'questions': [{'id': n, 'question': f'Whose autobiography is entitled number {n}?',
+                       'answer': 'Maya Angelou', 'category': n % 6 + 1, 'difficulty': n % 5 + 1}
+                      for n in range(size)],
+        'totalQuestions': size,
+        'categories': {str(n): f'Category {n}' for n in range(1, 7)},
+        'currentCategory': 0,
+    }
+
+def median_ms(call, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+def run(database_url):
+    print(f"{'payload':<16} {'stdlib ms':>10} {'orjson ms':>10} {'speedup':>8}")
+    for size in SIZES:
+        data = payload(size)
+        repeat = max(REPEAT * 10 // size, 5)
+        stdlib_ms = median_ms(lambda: stdlib_dumps(data), repeat)
+        orjson_ms = median_ms(lambda: orjson_dumps(data), repeat)
+        print(f"{size:>6} questions {stdlib_ms:>10.3f} {orjson_ms:>10.3f} {stdlib_ms / orjson_ms:>7.1f}x")
+
+    clients = {encoder: create_app({'SQLALCHEMY_DATABASE_URI': database_url, 'JSON_ENCODER': encoder,
+                                    'SEARCH_MAX_RESULTS': 1000}).test_client()
+               for encoder in ('stdlib', 'orjson')}
+    print(f"\n{'request':<16} {'stdlib ms':>10} {'orjson ms':>10} {'speedup':>8}")
+    for name, method, path, body in REQUESTS:
+        timings = {}
+        for encoder, client in clients.items():
+            call = lambda: getattr(client, method)(path, json=body)
+            call()
+            timings[encoder] = median_ms(call, REPEAT)
+        print(f"{name:<16} {timings['stdlib']:>10.3f} {timings['orjson']:>10.3f} "
+              f"{timings['stdlib'] / timings['orjson']:>7.2f}x")
+
+if __name__ == "__main__":
+    load_dotenv()
+    if orjson is None:
+        sys.exit("orjson is not installed")
+    run(sys.argv[1] if len(sys.argv) > 1 else os.getenv('database_path'))
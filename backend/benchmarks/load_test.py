@@ -0,0 +1,75 @@
+import argparse
+import http.client
+import json
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+"""
+Load test
+    drives a running server with keep-alive connections from a pool of
+    client threads for a fixed time and reports throughput and latency. Run
+    it against `flask run` and against gunicorn on the same machine to
+    compare them.
+
+    python benchmarks/load_test.py http://127.0.0.1:5000 --threads 16 --seconds 20
+"""
+REQUESTS = (
+    ('GET', '/categories', None),
+    ('GET', '/questions?page=1', None),
+    ('GET', '/questions?page=2', None),
+    ('POST', '/questions', {'searchTerm': 'title'}),
+)
+
+def worker(base, deadline, latencies, errors, lock):
+    connection = http.client.HTTPConnection(base.hostname, base.port or 80, timeout=30)
+    mine, failed, step = [], 0, 0
+    while time.perf_counter() < deadline:
+        method, path, body = REQUESTS[step % len(REQUESTS)]
+        step += 1
+        payload = json.dumps(body) if body is not None else None
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        started = time.perf_counter()
+        try:
+            connection.request(method, path, body=payload, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                failed += 1
+            if response.getheader('Connection', '').lower() == 'close':
+                connection.close()
+        except (OSError, http.client.HTTPException):
+            failed += 1
+            connection.close()
+        mine.append(time.perf_counter() - started)
+    with lock:
+        latencies.extend(mine)
+        errors.append(failed)
+
+def run(url, threads, seconds):
+    base = urlsplit(url)
+    latencies, errors, lock = [], [], threading.Lock()
+    deadline = time.perf_counter() + seconds
+    pool = [threading.Thread(target=worker, args=(base, deadline, latencies, errors, lock))
+            for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+    latencies.sort()
+    percentile = lambda p: latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000
+    print(f"{url}  threads={threads}  seconds={seconds}")
+    print(f"requests {len(latencies)}  errors {sum(errors)}  "
+          f"throughput {len(latencies) / seconds:.1f} req/s")
+    print(f"latency ms  mean {statistics.mean(latencies) * 1000:.1f}  p50 {percentile(0.50):.1f}  "
+          f"p95 {percentile(0.95):.1f}  p99 {percentile(0.99):.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load test the trivia API.')
+    parser.add_argument('url', nargs='?', default='http://127.0.0.1:5000')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--seconds', type=int, default=20)
+    arguments = parser.parse_args()
+    run(arguments.url, arguments.threads, arguments.seconds)
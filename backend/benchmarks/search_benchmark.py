@@ -0,0 +1,99 @@
+import os
+import statistics
+import sys
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flaskr import QUESTIONS_PER_PAGE, default_config
+from flaskr.search import ilike_select, trigram_select, window_statements
+
+"""
+Search benchmark
+    times the statements of a POST /questions search page, as built by
+    flaskr/search.py: the page and the windowed count of the 'ilike' mode
+    without an index, and of the 'trigram' mode (the first matches ranked by
+    similarity) with the pg_trgm GIN index of `flask install-trigram`. They run
+    against a scratch `questions` table in the benchmark_search schema,
+    filled to each size by cycling through the rows of `questions`, so load
+    trivia.psql into the target database first.
+
+    python benchmarks/search_benchmark.py [database_url]
+"""
+SIZES = (10000, 100000, 1000000)
+TERMS = ('title', 'Tom Hanks', 'xyz123', 'a')
+REPEAT = 5
+SCHEMA = 'benchmark_search'
+WINDOW = default_config()['SEARCH_MAX_RESULTS']
+
+def fill(engine, size):
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        connection.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        connection.execute(text(
+            f"CREATE TABLE {SCHEMA}.questions (id serial PRIMARY KEY, question text, "
+            "answer text, difficulty integer, category integer)"))
+        # every copy gets a suffix so the rows are not identical
+        connection.execute(text(f"""
+            INSERT INTO {SCHEMA}.questions (question, answer, difficulty, category)
+            SELECT seed.question || ' #' || g, seed.answer, seed.difficulty, seed.category
+            FROM generate_series(1, :size) AS g
+            JOIN (SELECT row_number() OVER (ORDER BY id) - 1 AS n, question, answer,
+                         difficulty, category
+                  FROM public.questions) AS seed
+              ON seed.n = g % (SELECT count(*) FROM public.questions)
+        """), {'size': size})
+        connection.execute(text(f"ANALYZE {SCHEMA}.questions"))
+
+def add_trigram_index(engine):
+    with engine.begin() as connection:
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm SCHEMA public"))
+        connection.execute(text(
+            f"CREATE INDEX questions_question_trgm ON {SCHEMA}.questions USING gin (question gin_trgm_ops)"))
+        connection.execute(text(f"ANALYZE {SCHEMA}.questions"))
+
+def page_statements(selections):
+    return window_statements(selections, 0, QUESTIONS_PER_PAGE, WINDOW)
+
+def scans(plan):
+    found = [plan['Node Type']] if 'Scan' in plan['Node Type'] else []
+    for child in plan.get('Plans', []):
+        found.extend(scans(child))
+    return found
+
+def explain(connection, statement):
+    compiled = statement.compile(dialect=connection.dialect)
+    return connection.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {compiled}", compiled.params).scalar()[0]
+
+def measure(engine, statements):
+    timings = []
+    with engine.connect() as connection:
+        # the unqualified `questions` of the statements is the scratch table
+        connection.execute(text(f"SET search_path TO {SCHEMA}, public"))
+        matches = connection.execute(statements[1]).scalar()
+        for _ in range(REPEAT):
+            plans = [explain(connection, statement) for statement in statements]
+            timings.append(sum(plan['Execution Time'] for plan in plans))
+    return matches, statistics.median(timings), '/'.join(scans(plans[0]['Plan']))
+
+def run(database_url):
+    engine = create_engine(database_url)
+    print(f"{'rows':>9} {'term':<10} {'matches':>8} {'ilike ms':>10} {'trigram ms':>11}  trigram plan")
+    try:
+        for size in SIZES:
+            fill(engine, size)
+            plain = {term: measure(engine, page_statements(ilike_select(term))) for term in TERMS}
+            add_trigram_index(engine)
+            for term in TERMS:
+                matches, ilike_ms, _ = plain[term]
+                _, trigram_ms, scan = measure(engine, page_statements(trigram_select(term, WINDOW)))
+                matches = f'{WINDOW}+' if matches > WINDOW else matches
+                print(f"{size:>9} {term:<10} {matches:>8} {ilike_ms:>10.2f} {trigram_ms:>11.2f}  {scan}")
+    finally:
+        with engine.begin() as connection:
+            connection.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+
+if __name__ == "__main__":
+    load_dotenv()
+    run(sys.argv[1] if len(sys.argv) > 1 else os.getenv('database_path'))
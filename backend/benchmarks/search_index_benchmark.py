@@ -0,0 +1,54 @@
+import os
+import statistics
+import sys
+import time
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flaskr import create_app
+
+"""
+In-memory search index benchmark
+    times POST /questions searches through the SQL search path and through
+    the 'memory' backend against the same database, and reports how long the
+    index took to build and how much memory it holds.
+
+    python benchmarks/search_index_benchmark.py [database_url]
+"""
+TERMS = ('title', 'Tom Hanks', 'xyz123', 'a', 'the')
+REPEAT = 50
+
+def time_searches(app):
+    client = app.test_client()
+    results = {}
+    for term in TERMS:
+        timings = []
+        for _ in range(REPEAT):
+            started = time.perf_counter()
+            res = client.post('/questions', json={'searchTerm': term})
+            timings.append((time.perf_counter() - started) * 1000)
+        results[term] = (res.get_json()['totalQuestions'], statistics.median(timings))
+    return results
+
+def run(database_url):
+    sql_app = create_app({'SQLALCHEMY_DATABASE_URI': database_url})
+    sql = time_searches(sql_app)
+
+    started = time.perf_counter()
+    memory_app = create_app({'SQLALCHEMY_DATABASE_URI': database_url, 'SEARCH_BACKEND': 'memory'})
+    build_ms = (time.perf_counter() - started) * 1000
+    memory = time_searches(memory_app)
+
+    report = memory_app.extensions['trivia_search_index'].memory_report()
+    print(f"index: {report['questions']} questions, {report['words']} words, "
+          f"{report['bytes']['total'] / 1024:.1f} KiB, app start with build {build_ms:.1f} ms")
+    print(f"{'term':<10} {'matches':>8} {'sql ms':>8} {'memory ms':>10}")
+    for term in TERMS:
+        matches, sql_ms = sql[term]
+        _, memory_ms = memory[term]
+        print(f"{term:<10} {matches:>8} {sql_ms:>8.2f} {memory_ms:>10.2f}")
+
+if __name__ == "__main__":
+    load_dotenv()
+    run(sys.argv[1] if len(sys.argv) > 1 else os.getenv('database_path'))
@@ -0,0 +1,76 @@
+import os
+import statistics
+import sys
+import time
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import setup_db, db, format_rows, Question
+
+"""
+Serialization benchmark
+    time to turn N questions into the dicts the endpoints return, through
+    Question instances and format() and through format_rows. The rows live
+    in an in-memory SQLite database by default, so the numbers are mostly
+    Python time; pass a database URL to include a real driver.
+
+    python benchmarks/serialization_benchmark.py [database_url]
+"""
+SIZES = (10, 1000, 100000)
+REPEAT = 7
+
+def orm_path(selections):
+    return [question.format() for question in selections.all()]
+
+def rows_path(selections):
+    return format_rows(selections)
+
+def measure(path, selections):
+    timings = []
+    for _ in range(REPEAT):
+        db.session.expunge_all()
+        started = time.perf_counter()
+        path(selections)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+def fill(size):
+    Question.query.delete()
+    db.session.bulk_insert_mappings(Question, [
+        {'question': f'Question number {n}?', 'answer': f'Answer {n}',
+         'category': n % 6 + 1, 'difficulty': n % 5 + 1}
+        for n in range(size)])
+    db.session.commit()
+
+def scratch_url(path=None):
+    # only a database this run creates: fill() empties its questions table
+    if path is None:
+        return 'sqlite://'
+    if '://' in path or os.path.exists(path):
+        raise SystemExit(f'refusing {path}: pass the path of a SQLite file that does not exist yet')
+    return f'sqlite:///{os.path.abspath(path)}'
+
+def run(path=None):
+    database_url = scratch_url(path)
+    try:
+        measure_sizes(database_url)
+    finally:
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+def measure_sizes(database_url):
+    app = Flask(__name__)
+    setup_db(app, database_path=database_url)
+    with app.app_context():
+        db.create_all()
+        print(f"{'rows':>7} {'format() ms':>12} {'format_rows ms':>15} {'speedup':>8}")
+        for size in SIZES:
+            fill(size)
+            selections = Question.query.order_by(Question.id)
+            orm_ms = measure(orm_path, selections)
+            rows_ms = measure(rows_path, selections)
+            print(f"{size:>7} {orm_ms:>12.3f} {rows_ms:>15.3f} {orm_ms / rows_ms:>7.1f}x")
+
+if __name__ == "__main__":
+    run(sys.argv[1] if len(sys.argv) > 1 else None)
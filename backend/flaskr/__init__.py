@@ -1,25 +1,92 @@
+import io
 import os
-from flask import Flask, request, abort, jsonify
+import secrets
+import tempfile
+import base64
+import binascii
+import click
+from flask import Flask, request, abort, session, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-import random
 import json
-from models import setup_db, Question, Category
+from models import setup_db, db, pool_stats, format_rows, Question, QuestionCounter
+from .search import SEARCH_BACKENDS, search_page, install_fulltext, install_trigram
+from .search_index import init_search_index, rebuild_index
+from .category_cache import init_category_cache, category_cache
+from .quiz import random_question
+from .quiz_sessions import QUIZ_SESSION_STORES, init_quiz_sessions, quiz_sessions
+from .replicas import init_replicas, read_replica
+from .schema import init_migrations, check_schema
+from .json_encoding import JSON_ENCODERS, init_json, jsonify, dumps_line
+from .compression import init_compression, compression
+from .data_version import init_data_version, conditional
+from .response_cache import RESPONSE_CACHES, init_response_cache, response_cache, cached
+from .bulk_import import IMPORT_FORMATS, import_questions
+from .export import EXPORT_FORMATS, parse_filter, export_query, ndjson_chunks, csv_chunks
 
 QUESTIONS_PER_PAGE = 10
-Curent_category_global = None
 
-def pagination_question(request, questions):
-    page = request.args.get("page", 1, type=int)
+"""
+Current category
+    the category a client last browsed is kept in its signed session cookie,
+    not in the server process, so every thread and every worker sharing the
+    SECRET_KEY sees the same value for the same client. 0 means none.
+"""
+def get_current_category():
+    return session.get('current_category', 0)
+
+def set_current_category(category_id):
+    session['current_category'] = category_id
+
+def pagination_question(request, selections):
+    page = max(request.args.get("page", 1, type=int), 1)
     start = (page - 1) * QUESTIONS_PER_PAGE
-    end = start + QUESTIONS_PER_PAGE
-    
-    format_question = [question.format() for question in questions]
-    return format_question[start : end]  
+
+    return format_rows(selections.offset(start).limit(QUESTIONS_PER_PAGE))
+
+"""
+Keyset pagination
+    the ``after`` cursor is an opaque token wrapping the id of the last
+    question of the previous page, so every page is an index seek on the
+    primary key no matter how deep the client has scrolled.
+"""
+def encode_cursor(question_id):
+    token = base64.urlsafe_b64encode(f'q:{question_id}'.encode())
+    return token.decode().rstrip('=')
+
+def parse_cursor(token):
+    if token is None:
+        return None
+    if token == '':
+        return 0
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        prefix, question_id = base64.urlsafe_b64decode(padded).decode().split(':')
+        if prefix != 'q':
+            raise ValueError(token)
+        return int(question_id)
+    except (binascii.Error, UnicodeDecodeError) as error:
+        raise ValueError(token) from error
+
+def decode_cursor(request):
+    try:
+        return parse_cursor(request.args.get('after', None))
+    except ValueError:
+        abort(400)
+
+def cursor_question(selections, after):
+    questions = format_rows(selections.filter(Question.id > after).order_by(Question.id)
+                            .limit(QUESTIONS_PER_PAGE + 1))
+
+    next_cursor = None
+    if len(questions) > QUESTIONS_PER_PAGE:
+        questions = questions[:QUESTIONS_PER_PAGE]
+        next_cursor = encode_cursor(questions[-1]['id'])
+    return questions, next_cursor
 
 def get_list_categories():
-    selections = Category.query.order_by(Category.id).all()
-    return selections
+    return {str(category_id): category_type
+            for category_id, category_type in category_cache().categories().items()}
 
 def create_question(body):
     new_question_description =  body.get("question", None)
@@ -34,26 +101,89 @@ def create_question(body):
         'success': True
     })
         
-def search_question(search_term):
-    question_filter = Question.query.filter(Question.question.ilike(f'%{search_term}%')).all()
-    format_question_filter = [question.format() for question in question_filter]
+def search_question(search_term, body):
+    page = int(body.get('page', 1))
+    limit = body.get('limit', None)
+    if limit is not None:
+        limit = int(limit)
+    format_question_filter, total, capped = search_page(search_term, page, limit)
 
     return jsonify({
         'questions' : format_question_filter,
-        'totalQuestions' : len(format_question_filter),
-        'currentCategory' : Curent_category_global
+        'totalQuestions' : total,
+        'totalCapped' : capped,
+        'currentCategory' : get_current_category()
     })  
 
+
+"""
+default_config()
+    settings read from the environment, shared by create_app and
+    create_async_app
+"""
+def default_config():
+    return {
+        # workers must share the key to read each other's session cookies
+        'SECRET_KEY': os.getenv('SECRET_KEY') or secrets.token_hex(32),
+        'SEARCH_BACKEND': os.getenv('SEARCH_BACKEND', 'auto'),
+        'SEARCH_MAX_RESULTS': int(os.getenv('SEARCH_MAX_RESULTS', 1000)),
+        'SEARCH_INDEX_MAX_AGE': int(os.getenv('SEARCH_INDEX_MAX_AGE', 0)),
+        'CATEGORY_CACHE_TTL': int(os.getenv('CATEGORY_CACHE_TTL', 60)),
+        'QUIZ_SESSION_STORE': os.getenv('QUIZ_SESSION_STORE', 'sql'),
+        'QUIZ_SESSION_TTL': int(os.getenv('QUIZ_SESSION_TTL', 3600)),
+        'DB_POOL_SIZE': int(os.getenv('DB_POOL_SIZE', 5)),
+        'DB_MAX_OVERFLOW': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+        'DB_POOL_TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', 30)),
+        'DB_POOL_PRE_PING': os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes'),
+        'DB_POOL_RECYCLE': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'REPLICA_STICKY_SECONDS': float(os.getenv('REPLICA_STICKY_SECONDS', 5)),
+        'JSON_ENCODER': os.getenv('JSON_ENCODER', 'auto'),
+        # an empty list turns compression off
+        'COMPRESSION_ENCODINGS': os.getenv('COMPRESSION_ENCODINGS', 'br,zstd,gzip'),
+        'COMPRESSION_MIN_SIZE': int(os.getenv('COMPRESSION_MIN_SIZE', 1024)),
+        'COMPRESSION_CACHE_BYTES': int(os.getenv('COMPRESSION_CACHE_BYTES', 8 * 1024 * 1024)),
+        'DATA_VERSION_TTL': float(os.getenv('DATA_VERSION_TTL', 2)),
+        # 0 refreshes cached values only once they expire
+        'EARLY_REFRESH_BETA': float(os.getenv('EARLY_REFRESH_BETA', 1)),
+        'RESPONSE_CACHE': os.getenv('RESPONSE_CACHE', 'memory'),
+        'RESPONSE_CACHE_BYTES': int(os.getenv('RESPONSE_CACHE_BYTES', 32 * 1024 * 1024)),
+        'RESPONSE_CACHE_DIR': os.getenv('RESPONSE_CACHE_DIR',
+                                        os.path.join(tempfile.gettempdir(), 'trivia-response-cache')),
+        'IMPORT_BATCH_SIZE': int(os.getenv('IMPORT_BATCH_SIZE', 1000)),
+        'EXPORT_BATCH_SIZE': int(os.getenv('EXPORT_BATCH_SIZE', 1000)),
+    }
         
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
+    app.config.update(default_config())
 
     if test_config is None:
         setup_db(app)
     else:
+        app.config.update(test_config)
         database_path = test_config.get('SQLALCHEMY_DATABASE_URI')
         setup_db(app, database_path=database_path)
+    init_migrations(app)
+    check_schema(app)
+
+    if app.config['SEARCH_BACKEND'] not in SEARCH_BACKENDS:
+        raise ValueError(f"unknown SEARCH_BACKEND {app.config['SEARCH_BACKEND']!r}")
+    if app.config['QUIZ_SESSION_STORE'] not in QUIZ_SESSION_STORES:
+        raise ValueError(f"unknown QUIZ_SESSION_STORE {app.config['QUIZ_SESSION_STORE']!r}")
+    if app.config['RESPONSE_CACHE'] not in RESPONSE_CACHES:
+        raise ValueError(f"unknown RESPONSE_CACHE {app.config['RESPONSE_CACHE']!r}")
+    if app.config['JSON_ENCODER'] not in JSON_ENCODERS:
+        raise ValueError(f"unknown JSON_ENCODER {app.config['JSON_ENCODER']!r}")
+    if app.config['SEARCH_BACKEND'] == 'memory':
+        init_search_index(app)
+    init_category_cache(app)
+    init_quiz_sessions(app)
+    init_replicas(app)
+    init_json(app)
+    init_compression(app)
+    init_data_version(app)
+    init_response_cache(app)
 
     CORS(app, resources={r"*": {"origins": "http://localhost:3000"}}, supports_credentials=True)
     @app.after_request
@@ -61,6 +191,50 @@ def create_app(test_config=None):
         response.headers.add("Access-Control-Allow-Headers", "Content-Type,Authorization, true")
         response.headers.add("Access-Control-Allow-Methods", "GET,PUT,POST,DELETE,OPTIONS")
         return response
+
+    @app.cli.command('rebuild-counters')
+    def rebuild_counters():
+        """Recount the questions of every category into question_counters."""
+        rows = QuestionCounter.rebuild()
+        click.echo(f'Rebuilt {rows} question counters.')
+
+    @app.cli.command('install-fulltext')
+    def install_fulltext_search():
+        """Add the tsvector column, trigger and GIN index used by search."""
+        install_fulltext()
+        click.echo('Installed full-text search on questions.')
+
+    @app.cli.command('install-trigram')
+    def install_trigram_search():
+        """Enable pg_trgm and index questions.question for substring search."""
+        install_trigram()
+        click.echo('Installed trigram index on questions.question.')
+
+    @app.cli.command('import-questions')
+    @click.argument('source', type=click.File('r', encoding='utf-8'))
+    @click.option('--format', 'input_format', type=click.Choice(IMPORT_FORMATS),
+                  help='Input format, guessed from the file extension when left out.')
+    @click.option('--batch-size', type=int, help='Rows per transaction (IMPORT_BATCH_SIZE).')
+    def import_question_bank(source, input_format, batch_size):
+        """Load questions from an NDJSON or CSV file ('-' reads stdin)."""
+        if input_format is None:
+            input_format = 'csv' if source.name.endswith('.csv') else 'ndjson'
+
+        def progress(report):
+            click.echo(f'{report.imported} rows imported, {report.rejected} rejected '
+                       f'({report.imported / report.seconds():.0f} rows/s)')
+
+        report = import_questions(source, input_format,
+                                  batch_size or app.config['IMPORT_BATCH_SIZE'], progress)
+        for error in report.errors:
+            click.echo(f"line {error['line']}: {error['message']}", err=True)
+        summary = report.format()
+        click.echo(f"Imported {summary['imported']} questions in {summary['seconds']}s "
+                   f"({summary['rowsPerSecond']} rows/s), rejected {summary['rejected']}.")
+        if report.failure is not None:
+            raise click.ClickException(
+                f"stopped at lines {report.failure['line']}-{report.failure['lastLine']}: "
+                f"{report.failure['message']} ({report.batches} batches committed before)")
     
     """
     @DONE:
@@ -68,10 +242,12 @@ def create_app(test_config=None):
     for all available categories.
     """
     @app.route('/categories', methods=['GET'])
+    @conditional()
+    @cached()
     def retrive_categories():
+        read_replica()
         try:
-            selections = get_list_categories()
-            format_categories = {str(category.id): category.type for category  in selections}
+            format_categories = get_list_categories()
             return jsonify({
                 'categories': format_categories,
             })
@@ -91,21 +267,29 @@ def create_app(test_config=None):
     Clicking on the page numbers should update the questions.
     """
     @app.route('/questions', methods=['GET'])
+    @conditional(get_current_category)
+    @cached(get_current_category)
     def retrive_question():
+        after = decode_cursor(request)
+        read_replica()
         try: 
-            selections = Question.query.order_by(Question.id).all()
-            current_question = pagination_question(request, selections)
+            if after is None:
+                selections = Question.query.order_by(Question.id)
+                current_question = pagination_question(request, selections)
+            else:
+                current_question, next_cursor = cursor_question(Question.query, after)
             # if len(current_question) == 0: 
             #     abort(404)
-            list_categories = get_list_categories()
-        
-            format_categories = {str(category.id): category.type for category  in list_categories}
-            return jsonify({
+            format_categories = get_list_categories()
+            result = {
                 'questions': current_question,
-                'totalQuestions' : len(selections),
+                'totalQuestions' : QuestionCounter.get_total(),
                 'categories': format_categories,
-                'currentCategory' : Curent_category_global
-            })
+                'currentCategory' : get_current_category()
+            }
+            if after is not None:
+                result['next'] = next_cursor
+            return jsonify(result)
         except:
             abort(404)
             
@@ -163,10 +347,70 @@ def create_app(test_config=None):
             if search_term is None:
                 return create_question(body)
             else:
-                return search_question(search_term)
+                read_replica()
+                return search_question(search_term, body)
         except: 
             abort(422)
 
+    """
+    Bulk import
+        POST /questions/import takes NDJSON (application/x-ndjson) or CSV
+        (text/csv), or the ?format= given, streamed from the request body,
+        and answers with the number of rows imported and rejected, the
+        errors of the rejected rows and the rows per second. A failed batch
+        answers 422 with the same report and the lines it stopped at.
+    """
+    @app.route('/questions/import', methods=['POST'])
+    def import_question_rows():
+        input_format = request.args.get('format')
+        if input_format is None:
+            input_format = 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+        if input_format not in IMPORT_FORMATS:
+            abort(400)
+
+        def progress(report):
+            app.logger.info('import: %d rows imported, %d rejected', report.imported, report.rejected)
+
+        try:
+            lines = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+            report = import_questions(lines, input_format, app.config['IMPORT_BATCH_SIZE'], progress)
+        except:
+            abort(422)
+        if report.failure is not None:
+            # the batches before the failure are committed: say how far it got
+            return jsonify(dict(success=False, error=422, message='unprocessable', **report.format())), 422
+        return jsonify(dict(success=True, **report.format()))
+
+    """
+    Export
+        GET /questions/export streams every question, or those of the
+        ?category= and ?difficulty= given, as NDJSON or, with ?format=csv,
+        as CSV with a header row.
+    """
+    @app.route('/questions/export', methods=['GET'])
+    def export_question_bank():
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            abort(400)
+        try:
+            category = parse_filter(request.args, 'category')
+            difficulty = parse_filter(request.args, 'difficulty')
+        except ValueError:
+            abort(400)
+
+        read_replica()
+        batch_size = app.config['EXPORT_BATCH_SIZE']
+        rows = export_query(category, difficulty, batch_size)
+        if export_format == 'csv':
+            chunks = csv_chunks(rows, batch_size)
+        else:
+            chunks = ndjson_chunks(rows, dumps_line(app), batch_size)
+        # the request context, and the session reading the rows, stay
+        # open until the last chunk is sent
+        response = app.response_class(stream_with_context(chunks), mimetype=EXPORT_FORMATS[export_format])
+        response.headers['Content-Disposition'] = f'attachment; filename=questions.{export_format}'
+        return response
+
     """
     @DONE:
     Create a GET endpoint to get questions based on category.
@@ -177,24 +421,34 @@ def create_app(test_config=None):
     """
     @app.route('/categories/<int:category_id>/questions')
     def retrive_question_by_category(category_id):
+        # set on every request, also when the body comes from the cache
+        if category_cache().type_of(category_id) is None:
+            set_current_category(0)
+        else:
+            set_current_category(category_id)
+        return questions_of_category(category_id)
+
+    @cached()
+    def questions_of_category(category_id):
+        after = decode_cursor(request)
+        read_replica()
         try:
-            questions = Question.query.filter(Question.category == category_id).all()
-            format_questions = [question.format() for question in questions]
-            currentCategory = Category.query.filter(Category.id == category_id).one_or_none()
-            global Curent_category_global
-            
-            if currentCategory is None:
-                categoryName = ''
-                Curent_category_global = 0
+            selections = Question.query.filter(Question.category == category_id)
+            if after is None:
+                format_questions = format_rows(selections)
             else:
-                categoryName = currentCategory.type
-                # global Curent_category_global
-                Curent_category_global = currentCategory.id
-            return jsonify({
+                format_questions, next_cursor = cursor_question(selections, after)
+            total_questions = QuestionCounter.get_total(category_id)
+            currentCategory = category_cache().type_of(category_id)
+            categoryName = '' if currentCategory is None else currentCategory
+            result = {
                 'questions':format_questions,
-                'totalQuestions' : len(format_questions),
+                'totalQuestions' : total_questions,
                 'currentCategory' : categoryName,
-            })
+            }
+            if after is not None:
+                result['next'] = next_cursor
+            return jsonify(result)
         except:
             abort(404)
     """
@@ -212,29 +466,24 @@ def create_app(test_config=None):
     def play():
         # try:
             body= request.get_json()
+            read_replica()
             previous_questions = body.get('previous_questions', [])
             quiz_category = body.get('quiz_category', None)
             quiz_category_id = quiz_category.get('type')
-            question_query = Question.query
+            category = None
             if quiz_category is not None:
-                category = Category.query.filter(Category.type == quiz_category_id).one_or_none()
-                if category is not None:
-                    question_query = question_query.filter(Question.category == category.id)
-            
-            if len(previous_questions) != 0:
-                question_query = question_query.filter(Question.id.notin_(previous_questions))
+                category = category_cache().id_of(quiz_category_id)
             
             if (category is not None) or (len(previous_questions) != 0):
-                questions = question_query.all()
+                next_question = random_question(category, set(previous_questions))
             else :
-                questions = []
+                next_question = None
                 
-            if len(questions) == 0: 
+            if next_question is None: 
                 return jsonify({
                     'question': None,
                 })
 
-            next_question = random.choice(questions)
             format_question = next_question.format()
             
             return jsonify({
@@ -242,6 +491,90 @@ def create_app(test_config=None):
             })
         # except:
         #     abort(422) 
+
+    """
+    Quiz sessions.
+    POST /quizzes/sessions starts a quiz in the given category (or all of them
+    when the category id is 0) and returns its session_id. Each
+    POST /quizzes/sessions/<session_id>/next returns a question not asked yet
+    in that session, or None once the category is exhausted. The server keeps
+    the asked questions, so requests stay the same size for the whole quiz.
+    """
+    @app.route('/quizzes/sessions', methods=['POST'])
+    def create_quiz_session():
+        body = request.get_json() or {}
+        quiz_category = body.get('quiz_category') or {}
+        category = None
+        if quiz_category.get('id', 0) != 0:
+            category = category_cache().id_of(quiz_category.get('type'))
+            if category is None:
+                abort(404)
+
+        return jsonify({
+            'success': True,
+            'session_id': quiz_sessions().create(category)
+        })
+
+    @app.route('/quizzes/sessions/<session_id>/next', methods=['POST'])
+    def play_quiz_session(session_id):
+        store = quiz_sessions()
+        state = store.load(session_id)
+        if state is None:
+            abort(404)
+        category, seen = state
+
+        next_question = random_question(category, seen)
+        if next_question is None:
+            return jsonify({
+                'question': None,
+            })
+
+        seen.add(next_question.id)
+        store.save(session_id, category, seen)
+        return jsonify({
+            'question' : next_question.format()
+        })
+
+    @app.route('/quizzes/sessions/<session_id>', methods=['DELETE'])
+    def delete_quiz_session(session_id):
+        return jsonify({
+            'success': quiz_sessions().delete(session_id),
+            'session_id': session_id
+        })
+    """
+    Operational endpoints.
+    GET /stats reports the in-process structures and the database
+    connection pools (primary and replicas) of this worker, and
+    POST /search/index rebuilds the in-memory search index from the database.
+    """
+    @app.route('/stats', methods=['GET'])
+    def retrive_stats():
+        stats = {
+            'categoryCache': category_cache().stats(),
+            'databasePool': pool_stats(db.engine),
+            'compression': compression().stats(),
+            'dataVersion': app.extensions['trivia_data_version'].stats()
+        }
+        if response_cache() is not None:
+            stats['responseCache'] = response_cache().stats()
+            stats['responseCache']['coalesced'] = app.extensions['trivia_response_flights'].stats()['coalesced']
+        if 'trivia_replicas' in app.extensions:
+            stats['replicas'] = app.extensions['trivia_replicas'].stats()
+        if 'trivia_search_index' in app.extensions:
+            stats['searchIndex'] = app.extensions['trivia_search_index'].memory_report()
+        return jsonify(stats)
+
+    @app.route('/search/index', methods=['POST'])
+    def rebuild_search_index():
+        index = app.extensions.get('trivia_search_index')
+        if index is None:
+            abort(404)
+        rebuild_index(index)
+        return jsonify({
+            'success': True,
+            'searchIndex': index.memory_report()
+        })
+
     """
     @DONE:
     Create error handlers for all expected errors
@@ -0,0 +1,373 @@
+import os
+import random
+from databases import Database
+from sqlalchemy import func, select
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.middleware.sessions import SessionMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from models import (database_path, Question, Category, ALL_CATEGORIES, category_key, parse_category,
+                    count_select, counter_select, counter_update, counter_seed, data_version_select,
+                    data_version_update, data_version_seed)
+from . import QUESTIONS_PER_PAGE, default_config, encode_cursor, parse_cursor
+from .json_encoding import stdlib_dumps, select_dumps
+from .quiz import (SAMPLE_ATTEMPTS, FALLBACK_ROWS, id_range, id_at_or_after, id_before, ids_from,
+                   seen_in_category, seen_chunks, counter_key, keep, fallback_spans)
+from .search import (SEARCH_BACKENDS, INSTALLED_CHECKS, pick_backend, needs_lexemes, lexeme_count,
+                     page_bounds, window_statements, search_select as matches_select)
+
+"""
+Async variant
+    create_async_app serves the routes of create_app (/categories,
+    /questions, /questions/<id>, /categories/<id>/questions and /quizzes)
+    with the same JSON, as a Starlette ASGI application on the `databases`
+    async driver (asyncpg for Postgres) and its connection pool:
+
+    uvicorn asgi:app
+
+    Queries are built with SQLAlchemy Core on the tables declared in
+    models.py. The in-memory search backend, quiz sessions and operational
+    endpoints are only served by create_app.
+"""
+questions = Question.__table__
+categories = Category.__table__
+
+class TriviaJSONResponse(JSONResponse):
+    # same bytes as Flask's jsonify: sorted keys, compact, trailing newline;
+    # the encoder is picked from JSON_ENCODER in the environment
+    dumps = staticmethod(select_dumps(os.getenv('JSON_ENCODER', 'auto')) or stdlib_dumps)
+
+    def render(self, content):
+        return self.dumps(content)
+
+def format_question(row):
+    return {
+        'id': row['id'],
+        'question': row['question'],
+        'answer': row['answer'],
+        'category': row['category'],
+        'difficulty': row['difficulty']
+        }
+
+def get_current_category(request):
+    return request.session.get('current_category', 0)
+
+def int_arg(request, name, default):
+    try:
+        return int(request.query_params.get(name, default))
+    except ValueError:
+        return default
+
+def decode_cursor(request):
+    try:
+        return parse_cursor(request.query_params.get('after', None))
+    except ValueError:
+        raise HTTPException(400)
+
+async def list_categories(database):
+    rows = await database.fetch_all(select([categories]).order_by(categories.c.id))
+    return {str(row['id']): row['type'] for row in rows}
+
+async def category_id_of(database, category_type):
+    return await database.fetch_val(select([categories.c.id]).where(categories.c.type == category_type))
+
+async def get_total(database, category=ALL_CATEGORIES):
+    key = category_key(category)
+    if key is None:
+        return 0
+    total = await database.fetch_val(counter_select(key))
+    if total is None:
+        return await database.fetch_val(count_select(key))
+    return total
+
+async def bump_counters(database, category, delta):
+    # `databases` does not report the rows an UPDATE matched, so the row
+    # is looked up first; the caller's transaction keeps the two together
+    for key in (ALL_CATEGORIES, category_key(category)):
+        if key is None:
+            continue
+        if await database.fetch_val(counter_select(key)) is None:
+            await database.execute(counter_seed(key))
+        else:
+            await database.execute(counter_update(key, delta))
+
+async def bump_data_version(database):
+    if await database.fetch_val(data_version_select()) is None:
+        await database.execute(data_version_seed())
+    else:
+        await database.execute(data_version_update())
+
+async def cursor_question(database, selections, after):
+    rows = await database.fetch_all(selections.where(questions.c.id > after)
+                                    .order_by(questions.c.id).limit(QUESTIONS_PER_PAGE + 1))
+    next_cursor = None
+    if len(rows) > QUESTIONS_PER_PAGE:
+        rows = rows[:QUESTIONS_PER_PAGE]
+        next_cursor = encode_cursor(rows[-1]['id'])
+    return [format_question(row) for row in rows], next_cursor
+
+async def is_installed(request, backend):
+    installed = request.app.state.installed
+    if backend not in installed:
+        database = request.app.state.database
+        if database.url.scheme.startswith('postgres'):
+            installed[backend] = await database.fetch_val(INSTALLED_CHECKS[backend]) is not None
+        else:
+            installed[backend] = False
+    return installed[backend]
+
+async def search_select(request, search_term, window):
+    database = request.app.state.database
+    installed = {backend for backend in INSTALLED_CHECKS if await is_installed(request, backend)}
+    backend = pick_backend(request.app.state.config['SEARCH_BACKEND'], installed)
+    lexemes = 0
+    if needs_lexemes(backend, search_term):
+        lexemes = await database.fetch_val(lexeme_count(search_term))
+    return matches_select(backend, search_term, window, installed, lexemes)
+
+async def random_question(database, category, seen):
+    bounds = await database.fetch_one(id_range(category))
+    low, high = bounds[0], bounds[1]
+    if low is None:
+        return None
+    total = await get_total(database, counter_key(category))
+    if len(seen) >= total:
+        covered = 0
+        for chunk in seen_chunks(seen):
+            covered += await database.fetch_val(seen_in_category(category, chunk))
+        if covered >= total:
+            return None
+
+    question_id = None
+    for _ in range(SAMPLE_ATTEMPTS):
+        found = await database.fetch_val(id_at_or_after(category, random.randint(low, high)))
+        if found is None or found in seen:
+            continue
+        if keep(found, await database.fetch_val(id_before(category, found)), low):
+            question_id = found
+            break
+
+    if question_id is None:
+        for start, end in fallback_spans(low, high):
+            while question_id is None and start <= end:
+                ids = [row[0] for row in await database.fetch_all(ids_from(category, start, end))]
+                question_id = next((found for found in ids if found not in seen), None)
+                if len(ids) < FALLBACK_ROWS:
+                    break
+                start = ids[-1] + 1
+            if question_id is not None:
+                break
+    if question_id is None:
+        return None
+    return await database.fetch_one(select([questions]).where(questions.c.id == question_id))
+
+async def create_question(request, body):
+    database = request.app.state.database
+    async with database.transaction():
+        await database.execute(questions.insert().values(
+            question=body.get("question", None),
+            answer=body.get("answer", None),
+            difficulty=body.get("difficulty", None),
+            category=parse_category(body.get("category", None))))
+        await bump_counters(database, body.get("category", None), 1)
+        await bump_data_version(database)
+    return TriviaJSONResponse({
+        'success': True
+    })
+
+async def search_question(request, search_term, body):
+    database = request.app.state.database
+    window = request.app.state.config['SEARCH_MAX_RESULTS']
+    page = int(body.get('page', 1))
+    limit = body.get('limit', None)
+    if limit is not None:
+        limit = int(limit)
+    start, size = page_bounds(page, limit, window)
+    selections = await search_select(request, search_term, window)
+    page_statement, count_statement = window_statements(selections, start, size, window)
+
+    rows = []
+    if page_statement is not None:
+        rows = await database.fetch_all(page_statement)
+    total = await database.fetch_val(count_statement)
+    return TriviaJSONResponse({
+        'questions' : [format_question(row) for row in rows],
+        'totalQuestions' : min(total, window),
+        'totalCapped' : total > window,
+        'currentCategory' : get_current_category(request)
+    })
+
+async def retrive_categories(request):
+    try:
+        return TriviaJSONResponse({
+            'categories': await list_categories(request.app.state.database),
+        })
+    except Exception:
+        raise HTTPException(404)
+
+async def retrive_question(request):
+    database = request.app.state.database
+    after = decode_cursor(request)
+    try:
+        if after is None:
+            page = max(int_arg(request, 'page', 1), 1)
+            rows = await database.fetch_all(select([questions]).order_by(questions.c.id)
+                                            .offset((page - 1) * QUESTIONS_PER_PAGE).limit(QUESTIONS_PER_PAGE))
+            current_question = [format_question(row) for row in rows]
+        else:
+            current_question, next_cursor = await cursor_question(database, select([questions]), after)
+        result = {
+            'questions': current_question,
+            'totalQuestions' : await get_total(database),
+            'categories': await list_categories(database),
+            'currentCategory' : get_current_category(request)
+        }
+        if after is not None:
+            result['next'] = next_cursor
+        return TriviaJSONResponse(result)
+    except Exception:
+        raise HTTPException(404)
+
+async def delete_row(database, question_id):
+    """Delete the question in the current transaction and return its row,
+    or None when there was no row to delete."""
+    where = questions.c.id == question_id
+    if database.url.scheme.startswith('postgres'):
+        return await database.fetch_one(questions.delete().where(where).returning(questions.c.category))
+    # SQLite has no RETURNING here; changes() tells whether this DELETE,
+    # on the connection of the transaction, removed the row
+    row = await database.fetch_one(select([questions.c.category]).where(where))
+    await database.execute(questions.delete().where(where))
+    if await database.fetch_val('SELECT changes()') == 0:
+        return None
+    return row
+
+async def delete_question(request):
+    database = request.app.state.database
+    question_id = request.path_params['question_id']
+    try:
+        async with database.transaction():
+            row = await delete_row(database, question_id)
+            if row is not None:
+                await bump_counters(database, row['category'], -1)
+                await bump_data_version(database)
+        return TriviaJSONResponse({
+            'success': row is not None,
+            'question_id': question_id
+        })
+    except Exception:
+        raise HTTPException(404)
+
+async def post_questions(request):
+    body = await request.json()
+    search_term = body.get('searchTerm', None)
+    try:
+        if search_term is None:
+            return await create_question(request, body)
+        return await search_question(request, search_term, body)
+    except Exception:
+        raise HTTPException(422)
+
+async def retrive_question_by_category(request):
+    database = request.app.state.database
+    category_id = request.path_params['category_id']
+    after = decode_cursor(request)
+    try:
+        selections = select([questions]).where(questions.c.category == category_id)
+        if after is None:
+            format_questions = [format_question(row) for row in await database.fetch_all(selections)]
+        else:
+            format_questions, next_cursor = await cursor_question(database, selections, after)
+        category_type = await database.fetch_val(
+            select([categories.c.type]).where(categories.c.id == category_id))
+        if category_type is None:
+            category_type = ''
+            request.session['current_category'] = 0
+        else:
+            request.session['current_category'] = category_id
+        result = {
+            'questions': format_questions,
+            'totalQuestions' : await get_total(database, category_id),
+            'currentCategory' : category_type,
+        }
+        if after is not None:
+            result['next'] = next_cursor
+        return TriviaJSONResponse(result)
+    except Exception:
+        raise HTTPException(404)
+
+async def play(request):
+    database = request.app.state.database
+    body = await request.json()
+    previous_questions = body.get('previous_questions', [])
+    quiz_category = body.get('quiz_category', None)
+    category = None
+    if quiz_category is not None:
+        category = await category_id_of(database, quiz_category.get('type'))
+
+    next_question = None
+    if (category is not None) or (len(previous_questions) != 0):
+        next_question = await random_question(database, category, set(previous_questions))
+    return TriviaJSONResponse({
+        'question': format_question(next_question) if next_question is not None else None
+    })
+
+ERROR_MESSAGES = {
+    400: "bad request.",
+    404: "resource not found",
+    422: "unprocessable",
+    500: "internal server error",
+}
+
+async def http_error(request, exc):
+    status = exc.status_code if isinstance(exc, HTTPException) else 500
+    return TriviaJSONResponse(
+        {"success": False, "error": status, "message": ERROR_MESSAGES[status]}, status_code=status)
+
+def create_async_app(test_config=None):
+    config = default_config()
+    config['SQLALCHEMY_DATABASE_URI'] = database_path
+    config['ASYNC_POOL_MIN_SIZE'] = int(os.getenv('ASYNC_POOL_MIN_SIZE', 1))
+    config['ASYNC_POOL_MAX_SIZE'] = int(os.getenv('ASYNC_POOL_MAX_SIZE', 10))
+    if test_config is not None:
+        config.update(test_config)
+    if config['SEARCH_BACKEND'] not in SEARCH_BACKENDS or config['SEARCH_BACKEND'] == 'memory':
+        raise ValueError(f"SEARCH_BACKEND {config['SEARCH_BACKEND']!r} is not available in the async app")
+
+    middleware = [
+        Middleware(CORSMiddleware, allow_origins=['http://localhost:3000'], allow_credentials=True,
+                   allow_headers=['Content-Type', 'Authorization', 'true'],
+                   allow_methods=['GET', 'PUT', 'POST', 'DELETE', 'OPTIONS']),
+        Middleware(SessionMiddleware, secret_key=config['SECRET_KEY']),
+    ]
+    if 'gzip' in config['COMPRESSION_ENCODINGS'].split(','):
+        middleware.append(Middleware(GZipMiddleware, minimum_size=config['COMPRESSION_MIN_SIZE']))
+
+    url = config['SQLALCHEMY_DATABASE_URI']
+    options = {}
+    if url.startswith('postgres'):
+        options = {'min_size': config['ASYNC_POOL_MIN_SIZE'], 'max_size': config['ASYNC_POOL_MAX_SIZE']}
+    database = Database(url, force_rollback=config.get('DATABASE_FORCE_ROLLBACK', False), **options)
+
+    app = Starlette(
+        routes=[
+            Route('/categories', retrive_categories, methods=['GET']),
+            Route('/questions', retrive_question, methods=['GET']),
+            Route('/questions', post_questions, methods=['POST']),
+            Route('/questions/{question_id:int}', delete_question, methods=['DELETE']),
+            Route('/categories/{category_id:int}/questions', retrive_question_by_category, methods=['GET']),
+            Route('/quizzes', play, methods=['POST']),
+        ],
+        middleware=middleware,
+        exception_handlers={400: http_error, 404: http_error, 422: http_error, 500: http_error},
+        on_startup=[database.connect],
+        on_shutdown=[database.disconnect],
+    )
+    app.state.config = config
+    app.state.database = database
+    app.state.installed = {}
+    return app
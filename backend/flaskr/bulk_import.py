@@ -0,0 +1,193 @@
+import csv
+import io
+import json
+import time
+from collections import Counter
+from models import db, notify_change, ALL_CATEGORIES, DataVersion, Question, QuestionCounter
+from .category_cache import category_cache
+
+"""
+Bulk import
+    POST /questions/import and `flask import-questions` load question banks
+    given as NDJSON (one JSON object per line) or CSV (with a header row),
+    with the fields of POST /questions: question, answer, category (id or
+    type) and difficulty. The input is read as a stream and every row is
+    checked against the cached categories; rows that do not pass are
+    reported with their line and skipped, the others are loaded in batches
+    of IMPORT_BATCH_SIZE rows.
+
+    Each batch is one transaction: its rows (through COPY on Postgres, a
+    single executemany elsewhere), the question counters and the data
+    version. A failing batch is rolled back and ends the import; the
+    batches before it stay, and the report says which lines failed and
+    why, so the caller knows where to resume. Listeners get one 'import'
+    change per import.
+"""
+IMPORT_FORMATS = ('ndjson', 'csv')
+IMPORT_FIELDS = ('question', 'answer', 'category', 'difficulty')
+DIFFICULTIES = range(1, 6)
+# errors kept in the report, all of them are counted
+IMPORT_MAX_ERRORS = 100
+
+COPY_QUESTIONS = 'COPY questions (question, answer, category, difficulty) FROM STDIN WITH (FORMAT csv)'
+
+class ImportReport:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.imported = 0
+        self.rejected = 0
+        self.batches = 0
+        self.errors = []
+        self.failure = None
+
+    def reject(self, line, message):
+        self.rejected += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({'line': line, 'message': message})
+
+    def fail(self, first_line, last_line, error):
+        # the driver error of a failed statement, without the SQL around it
+        self.failure = {
+            'line': first_line,
+            'lastLine': last_line,
+            'message': str(getattr(error, 'orig', None) or error),
+        }
+
+    def seconds(self):
+        return time.perf_counter() - self.started
+
+    def format(self):
+        seconds = self.seconds()
+        return {
+            'imported': self.imported,
+            'rejected': self.rejected,
+            'batches': self.batches,
+            'errors': self.errors,
+            'failed': self.failure,
+            'seconds': round(seconds, 3),
+            'rowsPerSecond': round(self.imported / seconds, 1) if seconds else None,
+        }
+
+def read_ndjson(lines):
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            yield number, None, f'invalid JSON: {error}'
+            continue
+        if not isinstance(row, dict):
+            yield number, None, 'not a JSON object'
+            continue
+        yield number, row, None
+
+def read_csv(lines):
+    reader = csv.DictReader(lines)
+    for row in reader:
+        yield reader.line_num, row, None
+
+READERS = {'ndjson': read_ndjson, 'csv': read_csv}
+
+def validate(row, by_id, by_type):
+    values = {}
+    for field in ('question', 'answer'):
+        value = row.get(field)
+        if not isinstance(value, str) or not value.strip():
+            return None, f'{field} is required'
+        if '\x00' in value:
+            # Postgres text cannot hold it, the whole batch would fail
+            return None, f'{field} contains a NUL character'
+        values[field] = value.strip()
+
+    category = row.get('category')
+    try:
+        category_id = int(category)
+    except (TypeError, ValueError):
+        category_id = by_type.get(category)
+    if category_id not in by_id:
+        return None, f'unknown category {category!r}'
+    values['category'] = category_id
+
+    try:
+        values['difficulty'] = int(row.get('difficulty'))
+    except (TypeError, ValueError):
+        values['difficulty'] = None
+    if values['difficulty'] not in DIFFICULTIES:
+        return None, f"difficulty must be between {DIFFICULTIES[0]} and {DIFFICULTIES[-1]}"
+    return values, None
+
+def copy_rows(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[field] for field in IMPORT_FIELDS])
+    buffer.seek(0)
+    # the raw connection of the session, so COPY runs in its transaction
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(COPY_QUESTIONS, buffer)
+    finally:
+        cursor.close()
+
+def load_batch(rows):
+    try:
+        if db.engine.dialect.name == 'postgresql':
+            copy_rows(rows)
+        else:
+            db.session.execute(Question.__table__.insert(), rows)
+        totals = Counter(row['category'] for row in rows)
+        QuestionCounter.bump_category(ALL_CATEGORIES, len(rows))
+        for category, total in totals.items():
+            QuestionCounter.bump_category(category, total)
+        DataVersion.bump()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+def import_questions(lines, format='ndjson', batch_size=1000, progress=None):
+    """Load the questions read from lines (an iterable of text lines) and
+    return the ImportReport. progress(report) is called after each batch.
+    A failure stops the import and is recorded in report.failure."""
+    by_id, by_type = category_cache().maps()
+    report = ImportReport()
+    batch = []
+    # first and last line of the rows in batch
+    span = [None, None]
+
+    def flush():
+        load_batch(batch)
+        report.imported += len(batch)
+        report.batches += 1
+        del batch[:]
+        span[0] = None
+        if progress is not None:
+            progress(report)
+
+    line = 0
+    try:
+        for line, row, error in READERS[format](lines):
+            if error is None:
+                row, error = validate(row, by_id, by_type)
+            if error is not None:
+                report.reject(line, error)
+                continue
+            batch.append(row)
+            span[0] = line if span[0] is None else span[0]
+            span[1] = line
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    except Exception as error:
+        # a failing batch, or input that cannot be read after line: either
+        # way nothing from the first line of the pending batch on is loaded
+        if span[0] is None:
+            span = [line + 1, line + 1]
+        report.fail(span[0], span[1], error)
+    finally:
+        if report.imported:
+            notify_change(Question.__tablename__, 'import', {'imported': report.imported})
+    return report
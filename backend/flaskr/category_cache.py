@@ -0,0 +1,120 @@
+import threading
+import time
+from flask import current_app
+from models import CATEGORY_VERSION_ID, Category, DataVersion, on_change, read_engine
+from .data_version import data_version
+from .single_flight import refresh_due
+
+"""
+Category cache
+    categories are read on almost every request (GET /categories, GET
+    /questions, each /quizzes step) and almost never written, so each
+    process keeps both the id -> type and the type -> id maps in memory,
+    per engine the reads go to (a lagging replica has its own).
+    Category.insert empties the cache of the process that made the write.
+    The maps keep the data version they were checked at. Once
+    data_version() is newer, the category version row, which only Category
+    writes bump, is read: the maps are reloaded if it moved, and otherwise
+    only take the new data version, so question writes cost one row read
+    and not a reload. A category written by another process is thus served
+    within DATA_VERSION_TTL, under the ETag of that version.
+    CATEGORY_CACHE_TTL bounds how long writes that do not bump the version
+    (psql) go unseen. The maps are reloaded by one request at a time, and
+    may be a little before the TTL is over (see single_flight).
+"""
+class CategoryMaps:
+
+    def __init__(self, by_id, by_type, version, category_version, loaded_at, load_seconds):
+        self.by_id = by_id
+        self.by_type = by_type
+        # data version the maps were checked at
+        self.version = version
+        self.category_version = category_version
+        self.loaded_at = loaded_at
+        self.load_seconds = load_seconds
+
+class CategoryCache:
+
+    def __init__(self, ttl=0, beta=1.0):
+        self.lock = threading.Lock()
+        self.ttl = ttl
+        self.beta = beta
+        # masked engine url -> CategoryMaps
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.checks = 0
+        self.invalidations = 0
+
+    def expired(self, entry):
+        return self.ttl and refresh_due(entry.loaded_at, self.ttl, entry.load_seconds, self.beta, time.time())
+
+    def load(self, version, category_version):
+        started = time.time()
+        selections = Category.query.order_by(Category.id).all()
+        return CategoryMaps({category.id: category.type for category in selections},
+                            {category.type: category.id for category in selections},
+                            version, category_version, started, time.time() - started)
+
+    def maps(self):
+        # repr masks the password, as in DataVersionCache
+        key = repr(read_engine().url)
+        # read outside the lock, it may query the database
+        version = data_version()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.expired(entry):
+                entry = None
+            if entry is not None and version > entry.version:
+                self.checks += 1
+                if DataVersion.get(CATEGORY_VERSION_ID) == entry.category_version:
+                    entry.version = version
+                else:
+                    entry = None
+            if entry is None:
+                self.misses += 1
+                # the category version before the rows, so a category
+                # written in between is loaded again next time
+                entry = self.load(version, DataVersion.get(CATEGORY_VERSION_ID))
+                self.entries[key] = entry
+            else:
+                self.hits += 1
+            return entry.by_id, entry.by_type
+
+    def categories(self):
+        return self.maps()[0]
+
+    def type_of(self, category_id):
+        return self.maps()[0].get(category_id)
+
+    def id_of(self, category_type):
+        return self.maps()[1].get(category_type)
+
+    def invalidate(self):
+        with self.lock:
+            self.entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'checks': self.checks,
+                'invalidations': self.invalidations,
+                'size': max((len(entry.by_id) for entry in self.entries.values()), default=0),
+            }
+
+def init_category_cache(app):
+    cache = CategoryCache(ttl=app.config['CATEGORY_CACHE_TTL'], beta=app.config['EARLY_REFRESH_BETA'])
+    app.extensions['trivia_category_cache'] = cache
+
+    def follow_writes(table, action, record):
+        if table == Category.__tablename__:
+            cache.invalidate()
+
+    on_change(app, follow_writes)
+    return cache
+
+def category_cache():
+    return current_app.extensions['trivia_category_cache']
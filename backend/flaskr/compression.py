@@ -0,0 +1,209 @@
+import hashlib
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+"""
+Response compression
+    JSON and text responses are compressed with the best encoding the
+    client accepts (Accept-Encoding, q-values respected) among
+    COMPRESSION_ENCODINGS, in server preference order. brotli ('br') and
+    zstandard ('zstd') are used when their packages are installed, gzip
+    always is. Bodies under COMPRESSION_MIN_SIZE bytes go out as they are.
+
+    The compressed bodies of GET responses are kept in an LRU cache keyed
+    by a digest of the body, up to COMPRESSION_CACHE_BYTES, so a page served
+    again is compressed once. Streamed responses are compressed chunk by
+    chunk and flushed after each one, so the client still receives rows as
+    they are produced. GET /stats reports bytes in and out, the CPU time
+    spent compressing and the cache hits under `compression`.
+"""
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/')
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ZSTD_LEVEL = 3
+
+class GzipStream:
+
+    def __init__(self):
+        # wbits 31 writes a gzip header with a zero mtime, so equal bodies
+        # compress to equal bytes
+        self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, chunk):
+        return self.compressor.compress(chunk) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+class BrotliStream:
+
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, chunk):
+        return self.compressor.process(chunk) + self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+class ZstdStream:
+
+    def __init__(self):
+        self.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, chunk):
+        return self.compressor.compress(chunk) + \
+            self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self.compressor.flush()
+
+def gzip_compress(body):
+    stream = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return stream.compress(body) + stream.flush()
+
+STREAMS = {'gzip': GzipStream}
+COMPRESSORS = {'gzip': gzip_compress}
+if brotli is not None:
+    STREAMS['br'] = BrotliStream
+    COMPRESSORS['br'] = lambda body: brotli.compress(body, quality=BROTLI_QUALITY)
+if zstandard is not None:
+    STREAMS['zstd'] = ZstdStream
+    COMPRESSORS['zstd'] = lambda body: zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+
+class ResponseCompressor:
+
+    def __init__(self, encodings, min_size, cache_bytes):
+        self.encodings = [encoding for encoding in encodings if encoding in COMPRESSORS]
+        self.min_size = min_size
+        self.cache_bytes = cache_bytes
+        self.cache = OrderedDict()
+        self.cached_bytes = 0
+        self.lock = threading.Lock()
+        self.counts = {'compressed': 0, 'streamed': 0, 'skipped': 0,
+                       'bytesIn': 0, 'bytesOut': 0, 'cpuSeconds': 0.0,
+                       'cacheHits': 0, 'cacheMisses': 0}
+
+    def record(self, **deltas):
+        with self.lock:
+            for key, delta in deltas.items():
+                self.counts[key] += delta
+
+    def cached(self, key):
+        with self.lock:
+            body = self.cache.get(key)
+            if body is not None:
+                self.cache.move_to_end(key)
+            return body
+
+    def store(self, key, body):
+        if len(body) > self.cache_bytes:
+            return
+        with self.lock:
+            if key in self.cache:
+                return
+            self.cache[key] = body
+            self.cached_bytes += len(body)
+            while self.cached_bytes > self.cache_bytes:
+                _, evicted = self.cache.popitem(last=False)
+                self.cached_bytes -= len(evicted)
+
+    def compress(self, encoding, body, cacheable):
+        key = (encoding, hashlib.blake2b(body, digest_size=16).digest())
+        if cacheable and self.cache_bytes:
+            compressed = self.cached(key)
+            if compressed is not None:
+                self.record(cacheHits=1, compressed=1, bytesIn=len(body), bytesOut=len(compressed))
+                return compressed
+        started = time.thread_time()
+        compressed = COMPRESSORS[encoding](body)
+        self.record(cacheMisses=1 if cacheable and self.cache_bytes else 0, compressed=1,
+                    bytesIn=len(body), bytesOut=len(compressed),
+                    cpuSeconds=time.thread_time() - started)
+        if cacheable and self.cache_bytes:
+            self.store(key, compressed)
+        return compressed
+
+    def compress_stream(self, encoding, chunks, charset):
+        stream = STREAMS[encoding]()
+        size_in = size_out = 0
+        cpu = 0.0
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode(charset)
+                if not chunk:
+                    continue
+                started = time.thread_time()
+                data = stream.compress(chunk)
+                cpu += time.thread_time() - started
+                size_in += len(chunk)
+                size_out += len(data)
+                yield data
+            data = stream.finish()
+            size_out += len(data)
+            yield data
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+            self.record(streamed=1, bytesIn=size_in, bytesOut=size_out, cpuSeconds=cpu)
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counts)
+            stats['cpuSeconds'] = round(stats['cpuSeconds'], 6)
+            stats['bytesSaved'] = stats['bytesIn'] - stats['bytesOut']
+            stats['cacheEntries'] = len(self.cache)
+            stats['cacheBytes'] = self.cached_bytes
+            stats['encodings'] = list(self.encodings)
+            return stats
+
+    def process(self, response):
+        if not (200 <= response.status_code < 300) or response.status_code == 204 \
+                or 'Content-Encoding' in response.headers \
+                or not response.mimetype.startswith(COMPRESSIBLE_TYPES):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(self.encodings)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = self.compress_stream(encoding, response.response, response.charset)
+            response.direct_passthrough = False
+            response.headers.pop('Content-Length', None)
+        else:
+            body = response.get_data()
+            if len(body) < self.min_size:
+                self.record(skipped=1)
+                return response
+            cacheable = request.method == 'GET' and 'no-store' not in response.headers.get('Cache-Control', '')
+            response.set_data(self.compress(encoding, body, cacheable))
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+def init_compression(app):
+    encodings = [encoding.strip() for encoding in app.config['COMPRESSION_ENCODINGS'].split(',')
+                 if encoding.strip()]
+    compressor = ResponseCompressor(encodings, app.config['COMPRESSION_MIN_SIZE'],
+                                    app.config['COMPRESSION_CACHE_BYTES'])
+    app.extensions['trivia_compression'] = compressor
+    if compressor.encodings:
+        app.after_request(compressor.process)
+    return compressor
+
+def compression():
+    return current_app.extensions['trivia_compression']
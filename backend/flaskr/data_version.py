@@ -0,0 +1,120 @@
+import functools
+import hashlib
+import threading
+import time
+from flask import current_app, request
+from models import DataVersion, on_change, read_engine
+from .replicas import read_replica
+from .single_flight import SingleFlight, refresh_due
+
+"""
+Conditional GET
+    every write made through the models bumps the data_version row, so a
+    response can be labelled with the version read before its data. Views
+    decorated with @conditional send a weak ETag made of that version and
+    of what else the response depends on, and answer a matching
+    If-None-Match with 304 without running the view.
+
+    Each process keeps the version for DATA_VERSION_TTL seconds, so a
+    client polling an unchanged page gets its 304 without a query. Writes
+    of the process drop its copy at once; writes made by other processes
+    are seen within the TTL. The copy is kept per engine the reads go to,
+    so the version of a lagging replica never labels data of another.
+    One request per engine reads the row, a little before the TTL is over
+    (see single_flight), while the others keep the copy they have.
+"""
+class DataVersionCache:
+
+    def __init__(self, ttl=0, beta=1.0):
+        self.lock = threading.Lock()
+        self.ttl = ttl
+        self.beta = beta
+        self.flights = SingleFlight()
+        # masked engine url -> (version, loaded at, seconds the read took)
+        self.versions = {}
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, key):
+        started = time.time()
+        version = DataVersion.get()
+        with self.lock:
+            self.misses += 1
+            self.versions[key] = (version, started, time.time() - started)
+        return version
+
+    def current(self):
+        # repr masks the password, which /stats would otherwise show
+        key = repr(read_engine().url)
+        now = time.time()
+        with self.lock:
+            cached = self.versions.get(key)
+        if cached is not None:
+            version, loaded_at, delta = cached
+            if not refresh_due(loaded_at, self.ttl, delta, self.beta, now):
+                with self.lock:
+                    self.hits += 1
+                return version
+            if now - loaded_at <= self.ttl:
+                # refreshing early: only the first request reads the row,
+                # the copy is still good for the others
+                leader, fresh = self.flights.run(key, lambda: self.load(key), wait=False)
+                if leader:
+                    return fresh
+                with self.lock:
+                    self.hits += 1
+                return version
+        leader, version = self.flights.run(key, lambda: self.load(key))
+        if not leader and version is None:
+            version = self.load(key)
+        return version
+
+    def invalidate(self):
+        with self.lock:
+            self.versions.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'versions': {key: version for key, (version, _, _) in self.versions.items()},
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.flights.stats()['coalesced'],
+            }
+
+def init_data_version(app):
+    cache = DataVersionCache(ttl=app.config['DATA_VERSION_TTL'], beta=app.config['EARLY_REFRESH_BETA'])
+    app.extensions['trivia_data_version'] = cache
+
+    def follow_writes(table, action, record):
+        cache.invalidate()
+
+    on_change(app, follow_writes)
+    return cache
+
+def data_version():
+    return current_app.extensions['trivia_data_version'].current()
+
+def make_etag(version, *parts):
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=8).hexdigest()
+    return f'{version}-{digest}'
+
+def conditional(*depends_on):
+    """Tag a GET view with the data version, the request path and query,
+    and the value of each depends_on() call."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            read_replica()
+            etag = make_etag(data_version(), request.full_path,
+                             *(dependency() for dependency in depends_on))
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+            response.set_etag(etag, weak=True)
+            # let browsers keep the body but revalidate it on every use
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
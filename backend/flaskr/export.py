@@ -0,0 +1,53 @@
+import csv
+import io
+from itertools import islice
+from models import QUESTION_COLUMNS, QUESTION_FIELDS, Question
+
+"""
+Export
+    GET /questions/export streams the question bank, ordered by id, as
+    NDJSON or CSV. The rows are fetched EXPORT_BATCH_SIZE at a time from a
+    server-side cursor (yield_per turns on stream_results, a named cursor
+    on Postgres), and each batch is encoded and sent as one chunk before the
+    next is fetched, so the memory used does not grow with the table.
+"""
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+def parse_filter(args, name):
+    value = args.get(name)
+    if value is None:
+        return None
+    return int(value)
+
+def export_query(category=None, difficulty=None, batch_size=1000):
+    query = Question.query
+    if category is not None:
+        query = query.filter(Question.category == category)
+    if difficulty is not None:
+        query = query.filter(Question.difficulty == difficulty)
+    return query.order_by(Question.id).with_entities(*QUESTION_COLUMNS).yield_per(batch_size)
+
+def batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+def ndjson_chunks(rows, dumps, batch_size):
+    for batch in batches(rows, batch_size):
+        yield b''.join(dumps(dict(zip(QUESTION_FIELDS, row))) for row in batch)
+
+def csv_chunks(rows, batch_size):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(QUESTION_FIELDS)
+    for batch in batches(rows, batch_size):
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # no rows, the header alone
+        yield buffer.getvalue().encode()
@@ -0,0 +1,97 @@
+import json
+import math
+import re
+import flask
+from flask import current_app
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+"""
+JSON encoding
+    the endpoints build their responses with jsonify from this module. It
+    produces the bytes of Flask's jsonify (sorted keys, compact separators,
+    non-ASCII escaped, trailing newline) with the encoder chosen by
+    JSON_ENCODER:
+
+    - 'orjson': orjson, which must be installed
+    - 'stdlib': Flask's own jsonify
+    - 'auto': orjson when it is installed, otherwise the stdlib (default)
+
+    A body orjson cannot reproduce exactly is encoded again with the stdlib:
+    one with non-ASCII text, non-string keys (the stdlib sorts int keys as
+    numbers), a type orjson does not encode like Flask (dates), or a float
+    orjson writes differently (NaN and infinities, exponents, fractions
+    below 1e-4). Debug mode and JSONIFY_PRETTYPRINT_REGULAR, or turning
+    off JSON_SORT_KEYS or JSON_AS_ASCII, always use Flask's jsonify.
+"""
+JSON_ENCODERS = ('auto', 'orjson', 'stdlib')
+
+if orjson is not None:
+    ORJSON_OPTIONS = (orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE |
+                      orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS)
+
+# orjson writes 1e16 and 1e-05 as 1e16 and 0.00001, the stdlib as 1e+16 and
+# 1e-05; text that merely looks like this only costs a stdlib encode
+FLOAT_FORMS = re.compile(rb'[0-9][eE]|0\.0000')
+
+def non_finite(data):
+    """Whether data holds a NaN or an infinity, which orjson writes as null."""
+    if isinstance(data, float):
+        return not math.isfinite(data)
+    if isinstance(data, dict):
+        return any(non_finite(value) for value in data.values())
+    if isinstance(data, (list, tuple)):
+        return any(non_finite(value) for value in data)
+    return False
+
+def stdlib_dumps(data):
+    return (json.dumps(data, sort_keys=True, separators=(',', ':')) + '\n').encode()
+
+def orjson_dumps(data, fallback=stdlib_dumps):
+    try:
+        body = orjson.dumps(data, option=ORJSON_OPTIONS)
+    except TypeError:
+        return fallback(data)
+    if not body.isascii() or FLOAT_FORMS.search(body):
+        return fallback(data)
+    if b'null' in body and non_finite(data):
+        return fallback(data)
+    return body
+
+def select_dumps(name):
+    """The dumps function for JSON_ENCODER name, None for the stdlib."""
+    if name not in JSON_ENCODERS:
+        raise ValueError(f"unknown JSON_ENCODER {name!r}")
+    if name == 'orjson' and orjson is None:
+        raise ValueError("JSON_ENCODER 'orjson' needs the orjson package")
+    if name == 'stdlib' or orjson is None:
+        return None
+    return orjson_dumps
+
+def init_json(app):
+    dumps = select_dumps(app.config['JSON_ENCODER'])
+    if not (app.config['JSON_SORT_KEYS'] and app.config['JSON_AS_ASCII']):
+        dumps = None
+    app.extensions['trivia_json_dumps'] = dumps
+    return dumps
+
+def dumps_line(app):
+    """The function encoding one value as a line of JSON (compact, sorted
+    keys, non-ASCII escaped) with the encoder of jsonify."""
+    return app.extensions.get('trivia_json_dumps') or stdlib_dumps
+
+def flask_dumps(data):
+    return (flask.json.dumps(data, separators=(',', ':')) + '\n').encode()
+
+def jsonify(*args, **kwargs):
+    dumps = current_app.extensions.get('trivia_json_dumps')
+    if dumps is None or current_app.debug or current_app.config['JSONIFY_PRETTYPRINT_REGULAR']:
+        return flask.jsonify(*args, **kwargs)
+    if args and kwargs:
+        raise TypeError('jsonify() behavior undefined when passed both args and kwargs')
+    data = args[0] if len(args) == 1 else args or kwargs
+    return current_app.response_class(dumps(data, fallback=flask_dumps),
+                                      mimetype=current_app.config['JSONIFY_MIMETYPE'])
@@ -0,0 +1,104 @@
+import random
+from sqlalchemy import func, select
+from models import db, ALL_CATEGORIES, Question, QuestionCounter
+
+"""
+Random question sampling
+    /quizzes needs one random question of a category that the player has
+    not seen yet, drawn uniformly among the unseen ones, at a cost that does
+    not grow with the size of the category.
+
+    A random id is drawn between the smallest and largest id of the
+    category and the first question at or after it is read from the
+    (category, id) index. That alone favours the question after a gap in
+    the ids: a question is found by as many draws as the gap before it is
+    wide. So a find is kept with probability 1 / gap, which makes every
+    question as likely as any other; the previous id, which gives the gap,
+    is one more index probe. Seen and rejected finds are drawn again, up to
+    SAMPLE_ATTEMPTS times.
+
+    When every attempt missed (most of the category has been played), the
+    ids are read FALLBACK_ROWS at a time from a random id on, wrapping
+    around, up to the first unseen one. That reads about as many rows as
+    there are seen questions, not the whole category, and is slightly
+    biased like the plain probe. A category whose questions have all been
+    seen is recognised by counting the seen ids that belong to it.
+
+    The statements are shared with create_async_app (asgi.py).
+"""
+SAMPLE_ATTEMPTS = 32
+FALLBACK_ROWS = 50
+# seen ids per IN list, below the SQLite parameter limit
+SEEN_CHUNK = 500
+
+questions = Question.__table__
+
+def in_category(selections, category):
+    if category is None:
+        return selections
+    return selections.where(questions.c.category == category)
+
+def id_range(category):
+    return in_category(select([func.min(questions.c.id), func.max(questions.c.id)]), category)
+
+def id_at_or_after(category, pivot):
+    return in_category(select([questions.c.id]), category) \
+        .where(questions.c.id >= pivot).order_by(questions.c.id).limit(1)
+
+def id_before(category, question_id):
+    return in_category(select([func.max(questions.c.id)]), category).where(questions.c.id < question_id)
+
+def ids_from(category, start, end):
+    return in_category(select([questions.c.id]), category) \
+        .where(questions.c.id.between(start, end)).order_by(questions.c.id).limit(FALLBACK_ROWS)
+
+def seen_in_category(category, chunk):
+    return in_category(select([func.count()]).select_from(questions), category) \
+        .where(questions.c.id.in_(chunk))
+
+def seen_chunks(seen):
+    seen = sorted(seen)
+    return [seen[start:start + SEEN_CHUNK] for start in range(0, len(seen), SEEN_CHUNK)]
+
+def counter_key(category):
+    return ALL_CATEGORIES if category is None else category
+
+def keep(question_id, previous, low):
+    # a find after a gap of n ids is reached by n draws: keep 1 in n
+    gap = question_id - (low - 1 if previous is None else previous)
+    return random.random() * gap < 1
+
+def fallback_spans(low, high):
+    pivot = random.randint(low, high)
+    return [(pivot, high), (low, pivot - 1)]
+
+def random_question(category, seen):
+    low, high = db.session.execute(id_range(category)).first()
+    if low is None:
+        return None
+    # only a long seen list can cover the category; count its part in it
+    total = QuestionCounter.get_total(counter_key(category))
+    if len(seen) >= total:
+        covered = sum(db.session.execute(seen_in_category(category, chunk)).scalar()
+                      for chunk in seen_chunks(seen))
+        if covered >= total:
+            return None
+
+    for _ in range(SAMPLE_ATTEMPTS):
+        question_id = db.session.execute(id_at_or_after(category, random.randint(low, high))).scalar()
+        if question_id is None or question_id in seen:
+            continue
+        previous = db.session.execute(id_before(category, question_id)).scalar()
+        if keep(question_id, previous, low):
+            return Question.query.get(question_id)
+
+    for start, end in fallback_spans(low, high):
+        while start <= end:
+            ids = [row[0] for row in db.session.execute(ids_from(category, start, end))]
+            for question_id in ids:
+                if question_id not in seen:
+                    return Question.query.get(question_id)
+            if len(ids) < FALLBACK_ROWS:
+                break
+            start = ids[-1] + 1
+    return None
@@ -0,0 +1,124 @@
+import secrets
+import threading
+from array import array
+from datetime import datetime, timedelta
+from flask import current_app
+from models import db, QuizSession
+
+"""
+Quiz sessions
+    instead of sending the whole previous_questions list on every step, a
+    client creates a session once and asks for the next question by id. The
+    server keeps the category and the questions already asked in a store
+    chosen by QUIZ_SESSION_STORE:
+
+    - 'sql': the quiz_sessions table of the application database, shared by
+      every worker (default)
+    - 'memory': a dict in the worker process, for single-process servers
+
+    Sessions untouched for QUIZ_SESSION_TTL seconds are dropped.
+"""
+QUIZ_SESSION_STORES = ('sql', 'memory')
+
+class SeenQuestions:
+    """Ids of the questions already asked, packed 4 bytes per id."""
+
+    def __init__(self, packed=b''):
+        self.ids = array('i')
+        self.ids.frombytes(packed)
+        self.lookup = set(self.ids)
+
+    def __contains__(self, question_id):
+        return question_id in self.lookup
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def add(self, question_id):
+        if question_id not in self.lookup:
+            self.ids.append(question_id)
+            self.lookup.add(question_id)
+
+    def pack(self):
+        return self.ids.tobytes()
+
+def new_session_id():
+    return secrets.token_hex(16)
+
+class MemoryQuizSessionStore:
+
+    def __init__(self, ttl):
+        self.ttl = timedelta(seconds=ttl)
+        self.lock = threading.Lock()
+        self.sessions = {}
+
+    def create(self, category):
+        now = datetime.utcnow()
+        session_id = new_session_id()
+        with self.lock:
+            expired = [key for key, (_, _, touched) in self.sessions.items()
+                       if now - touched > self.ttl]
+            for key in expired:
+                del self.sessions[key]
+            self.sessions[session_id] = (category, b'', now)
+        return session_id
+
+    def load(self, session_id):
+        with self.lock:
+            state = self.sessions.get(session_id)
+        if state is None or datetime.utcnow() - state[2] > self.ttl:
+            return None
+        return state[0], SeenQuestions(state[1])
+
+    def save(self, session_id, category, seen):
+        with self.lock:
+            self.sessions[session_id] = (category, seen.pack(), datetime.utcnow())
+
+    def delete(self, session_id):
+        with self.lock:
+            return self.sessions.pop(session_id, None) is not None
+
+class SQLQuizSessionStore:
+
+    def __init__(self, ttl):
+        self.ttl = timedelta(seconds=ttl)
+
+    def create(self, category):
+        now = datetime.utcnow()
+        QuizSession.query.filter(QuizSession.updated_at < now - self.ttl) \
+            .delete(synchronize_session=False)
+        session_id = new_session_id()
+        db.session.add(QuizSession(session_id, category, b'', now))
+        db.session.commit()
+        return session_id
+
+    def load(self, session_id):
+        session = QuizSession.query.get(session_id)
+        if session is None or datetime.utcnow() - session.updated_at > self.ttl:
+            return None
+        return session.category, SeenQuestions(session.seen)
+
+    def save(self, session_id, category, seen):
+        QuizSession.query.filter(QuizSession.id == session_id).update({
+            QuizSession.seen: seen.pack(),
+            QuizSession.updated_at: datetime.utcnow(),
+        }, synchronize_session=False)
+        db.session.commit()
+
+    def delete(self, session_id):
+        deleted = QuizSession.query.filter(QuizSession.id == session_id) \
+            .delete(synchronize_session=False)
+        db.session.commit()
+        return deleted > 0
+
+def init_quiz_sessions(app):
+    stores = {'sql': SQLQuizSessionStore, 'memory': MemoryQuizSessionStore}
+    store = stores[app.config['QUIZ_SESSION_STORE']](app.config['QUIZ_SESSION_TTL'])
+    app.extensions['trivia_quiz_sessions'] = store
+    return store
+
+def quiz_sessions():
+    return current_app.extensions['trivia_quiz_sessions']
@@ -0,0 +1,37 @@
+import time
+from flask import current_app, session, has_request_context, g
+from models import on_change, read_from
+
+"""
+Replica routing
+    read-only routes call read_replica() so that their queries run on the
+    next replica passed to setup_db, in turn. A client that has just written
+    must see its write, so every committed write marks the client's session
+    cookie and its reads stay on the primary for REPLICA_STICKY_SECONDS.
+    The mark travels with the client, so every worker honours it.
+"""
+STICKY_KEY = 'read_primary_until'
+
+def init_replicas(app):
+    replicas = app.extensions.get('trivia_replicas')
+    if replicas is None:
+        return None
+    window = app.config['REPLICA_STICKY_SECONDS']
+
+    def follow_writes(table, action, record):
+        if has_request_context():
+            session[STICKY_KEY] = time.time() + window
+
+    on_change(app, follow_writes)
+    return replicas
+
+def read_replica():
+    # a request keeps the replica it was first given
+    if g.get('trivia_read_replica') is not None:
+        return g.trivia_read_replica
+    replicas = current_app.extensions.get('trivia_replicas')
+    if replicas is None or session.get(STICKY_KEY, 0) > time.time():
+        return None
+    engine = replicas.next()
+    read_from(engine)
+    return engine
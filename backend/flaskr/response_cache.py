@@ -0,0 +1,194 @@
+import functools
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from flask import current_app, request
+from .data_version import data_version, make_etag
+from .replicas import read_replica
+from .single_flight import SingleFlight
+
+"""
+Response cache
+    GET /categories, GET /questions and GET /categories/<id>/questions keep
+    their serialized JSON bodies under a key made of the data version, the
+    path and query string and what else the response depends on (the
+    current category for /questions). A write bumps the version, so entries
+    of older data are never read again and age out of the LRU. The store is
+    chosen by RESPONSE_CACHE:
+
+    - 'memory': an LRU dict in the worker process (default)
+    - 'file': one file per entry in RESPONSE_CACHE_DIR, shared by every
+      worker of the machine; point it at /dev/shm to keep it in memory
+    - 'off': no cache
+
+    Both stores evict the least recently used bodies beyond
+    RESPONSE_CACHE_BYTES. Requests missing the same key together run the
+    view once: the first renders the body and the others wait for it (see
+    single_flight). With the file store this holds within a worker.
+"""
+RESPONSE_CACHES = ('memory', 'file', 'off')
+
+class MemoryResponseCache:
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            body = self.entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def set(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {'backend': 'memory', 'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'entries': len(self.entries), 'bytes': self.size}
+
+class FileResponseCache:
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        # bytes this process wrote since it last trimmed the directory
+        self.written = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.json')
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as entry:
+                body = entry.read()
+            # the modification time orders the entries for eviction
+            os.utime(path)
+        except FileNotFoundError:
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return body
+
+    def set(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        # written under a unique name and renamed, so readers in other
+        # workers never see a partial body
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(descriptor, 'wb') as entry:
+            entry.write(body)
+        os.replace(temporary, self.path(key))
+        with self.lock:
+            self.written += len(body)
+            trim = self.written > self.max_bytes // 10
+            if trim:
+                self.written = 0
+        if trim:
+            self.trim()
+
+    def trim(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                info = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            entries.append((info.st_mtime, info.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            total -= size
+            with self.lock:
+                self.evictions += 1
+
+    def stats(self):
+        names = [name for name in os.listdir(self.directory) if name.endswith('.json')]
+        with self.lock:
+            return {'backend': 'file', 'directory': self.directory, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions, 'entries': len(names)}
+
+def init_response_cache(app):
+    backend = app.config['RESPONSE_CACHE']
+    cache = None
+    if backend == 'memory':
+        cache = MemoryResponseCache(app.config['RESPONSE_CACHE_BYTES'])
+    elif backend == 'file':
+        cache = FileResponseCache(app.config['RESPONSE_CACHE_DIR'], app.config['RESPONSE_CACHE_BYTES'])
+    app.extensions['trivia_response_cache'] = cache
+    app.extensions['trivia_response_flights'] = SingleFlight()
+    return cache
+
+def response_cache():
+    return current_app.extensions.get('trivia_response_cache')
+
+def render(cache, key, view, args, kwargs):
+    response = current_app.make_response(view(*args, **kwargs))
+    body = None
+    if response.status_code == 200 and not response.is_streamed:
+        body = response.get_data()
+        cache.set(key, body)
+    # waiters get the body, never the response the leader goes on to change
+    return response, body
+
+def cached(*depends_on):
+    """Serve a GET view from the response cache, keyed like its ETag plus
+    the database it reads, and store its 200 bodies."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = response_cache()
+            if cache is None:
+                return view(*args, **kwargs)
+            read_replica()
+            key = make_etag(data_version(), current_app.config['SQLALCHEMY_DATABASE_URI'],
+                            request.full_path, *(dependency() for dependency in depends_on))
+            body = cache.get(key)
+            if body is None:
+                leader, result = current_app.extensions['trivia_response_flights'].run(
+                    key, lambda: render(cache, key, view, args, kwargs))
+                if leader:
+                    return result[0]
+                if result is None or result[1] is None:
+                    # nothing to share, the view runs for this request too
+                    return view(*args, **kwargs)
+                body = result[1]
+            return current_app.response_class(body, mimetype=current_app.config['JSONIFY_MIMETYPE'])
+        return wrapper
+    return decorator
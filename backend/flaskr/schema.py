@@ -0,0 +1,42 @@
+import os
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from flask_migrate import Migrate, upgrade
+from models import db
+
+"""
+Schema migrations
+    the tables are created and changed by the Alembic revisions in
+    backend/migrations, applied with `flask db upgrade`. Starting the app
+    does not touch the schema: it reads the revision recorded in the
+    database once and logs a warning when it is not the latest one, so a
+    worker never races another one to create or alter tables.
+"""
+MIGRATIONS_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                    'migrations')
+
+def init_migrations(app):
+    return Migrate(app, db, directory=MIGRATIONS_DIRECTORY)
+
+def head_revision():
+    config = Config(os.path.join(MIGRATIONS_DIRECTORY, 'alembic.ini'))
+    config.set_main_option('script_location', MIGRATIONS_DIRECTORY)
+    return ScriptDirectory.from_config(config).get_current_head()
+
+def schema_revision(engine):
+    with engine.connect() as connection:
+        return MigrationContext.configure(connection).get_current_revision()
+
+def check_schema(app):
+    with app.app_context():
+        current = schema_revision(db.engine)
+    head = head_revision()
+    if current != head:
+        app.logger.warning(f'database schema is at revision {current}, the code expects {head}; '
+                           'run `flask db upgrade`')
+    return current == head
+
+def upgrade_schema(app, revision='head'):
+    with app.app_context():
+        upgrade(directory=MIGRATIONS_DIRECTORY, revision=revision)
@@ -0,0 +1,197 @@
+from flask import current_app
+from sqlalchemy import func, literal_column, select, text
+from models import db, QUESTION_FIELDS, Question
+from .search_index import current_index
+
+"""
+Question search
+    POST /questions with a searchTerm goes through search_page. The
+    SEARCH_BACKEND setting picks how the term is matched:
+
+    - 'fulltext': ranked Postgres full-text search on questions.search_vector
+    - 'trigram': substring match served by the pg_trgm index, closest
+      questions first
+    - 'ilike': the original substring match on the question text
+    - 'memory': substring match from the in-process index (search_index.py)
+    - 'auto': the best of the Postgres ones that has been installed
+"""
+SEARCH_BACKENDS = ('auto', 'fulltext', 'trigram', 'ilike', 'memory')
+FULLTEXT_CONFIG = 'english'
+# below this length a word search is too coarse, keep substring semantics
+FULLTEXT_MIN_LENGTH = 3
+# largest page a client may ask for
+SEARCH_MAX_LIMIT = 100
+
+INSTALL_FULLTEXT = [
+    "ALTER TABLE questions ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    """
+    CREATE OR REPLACE FUNCTION questions_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('english', coalesce(NEW.question, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(NEW.answer, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS questions_search_vector_trigger ON questions",
+    """
+    CREATE TRIGGER questions_search_vector_trigger
+        BEFORE INSERT OR UPDATE OF question, answer ON questions
+        FOR EACH ROW EXECUTE PROCEDURE questions_search_vector_update()
+    """,
+    # backfill the rows that existed before the trigger
+    """
+    UPDATE questions SET search_vector =
+        setweight(to_tsvector('english', coalesce(question, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(answer, '')), 'B')
+    WHERE search_vector IS NULL
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_questions_search_vector ON questions USING gin (search_vector)",
+]
+
+INSTALL_TRIGRAM = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_questions_question_trgm ON questions USING gin (question gin_trgm_ops)",
+]
+
+# what each backend needs in the database, checked once per engine
+INSTALLED_CHECKS = {
+    # the index is created last, so the column and trigger exist with it
+    'fulltext': "SELECT 1 FROM pg_indexes "
+                "WHERE tablename = 'questions' AND indexname = 'ix_questions_search_vector'",
+    'trigram': "SELECT 1 FROM pg_indexes "
+               "WHERE tablename = 'questions' AND indexname = 'ix_questions_question_trgm'",
+}
+
+_installed = {}
+
+def is_installed(backend):
+    engine = db.engine
+    key = (str(engine.url), backend)
+    if key not in _installed:
+        if engine.dialect.name != 'postgresql':
+            _installed[key] = False
+        else:
+            found = db.session.execute(text(INSTALLED_CHECKS[backend])).first()
+            _installed[key] = found is not None
+    return _installed[key]
+
+def run_statements(statements):
+    with db.engine.begin() as connection:
+        for statement in statements:
+            connection.execute(text(statement))
+    _installed.clear()
+
+def install_fulltext():
+    run_statements(INSTALL_FULLTEXT)
+
+def install_trigram():
+    run_statements(INSTALL_TRIGRAM)
+
+def search_backend():
+    configured = current_app.config['SEARCH_BACKEND']
+    if configured == 'auto':
+        return pick_backend(configured, installed_backends())
+    return configured
+
+questions = Question.__table__
+
+def ilike_select(search_term):
+    # ordered by id so OFFSET/LIMIT pages are stable
+    return select([questions]).where(questions.c.question.ilike(f'%{search_term}%')) \
+        .order_by(questions.c.id)
+
+def ranked_select(match, rank, window):
+    # only the first window + 1 matches are ranked, not every match of a
+    # common term; the ranking orders the window, it does not pick it
+    candidates = select([questions.c.id]).where(match).limit(window + 1).alias('candidates')
+    return select([questions]) \
+        .select_from(questions.join(candidates, candidates.c.id == questions.c.id)) \
+        .order_by(rank.desc(), questions.c.id)
+
+def trigram_select(search_term, window):
+    # pg_trgm serves ILIKE from the GIN index; similarity only orders the hits
+    return ranked_select(questions.c.question.ilike(f'%{search_term}%'),
+                         func.similarity(questions.c.question, search_term), window)
+
+def fulltext_select(search_term, window):
+    tsquery = func.plainto_tsquery(FULLTEXT_CONFIG, search_term)
+    vector = literal_column('questions.search_vector')
+    return ranked_select(vector.op('@@')(tsquery), func.ts_rank(vector, tsquery), window)
+
+def needs_lexemes(backend, search_term):
+    # below FULLTEXT_MIN_LENGTH the term goes to substring matching anyway
+    return backend == 'fulltext' and len(search_term.strip()) >= FULLTEXT_MIN_LENGTH
+
+def lexeme_count(search_term):
+    # a term made only of stop words ('the', 'what') has an empty tsquery
+    return select([func.numnode(func.plainto_tsquery(FULLTEXT_CONFIG, search_term))])
+
+def pick_backend(configured, installed):
+    if configured == 'auto':
+        for candidate in ('fulltext', 'trigram'):
+            if candidate in installed:
+                return candidate
+        return 'ilike'
+    return configured
+
+def search_select(backend, search_term, window, installed, lexemes=0):
+    """The select of the matches of search_term, for a backend given by
+    pick_backend. installed is the set of installed backends and lexemes
+    the lexeme_count of the term, when needs_lexemes. Shared by create_app
+    and create_async_app, which only differ in how they run it."""
+    if backend == 'fulltext':
+        if needs_lexemes(backend, search_term) and lexemes > 0:
+            return fulltext_select(search_term, window)
+        backend = 'trigram' if 'trigram' in installed else 'ilike'
+    if backend == 'trigram':
+        return trigram_select(search_term, window)
+    return ilike_select(search_term)
+
+"""
+Result window
+    a search never reads past SEARCH_MAX_RESULTS matches: pages beyond the
+    window are empty and the total is counted up to the window only, so a
+    term that matches the whole bank costs the same as a rare one. Without
+    a limit the page is the whole window, as before paging was added.
+"""
+def page_bounds(page, limit, window):
+    if limit is None:
+        limit = window
+    else:
+        limit = min(max(limit, 1), SEARCH_MAX_LIMIT)
+    start = (max(page, 1) - 1) * limit
+    return start, max(min(limit, window - start), 0)
+
+def window_statements(selections, start, size, window):
+    """The page of selections (None when it is past the window) and the
+    count of its matches up to window + 1."""
+    page = selections.offset(start).limit(size) if size else None
+    matches = selections.order_by(None).limit(window + 1).alias('matches')
+    return page, select([func.count()]).select_from(matches)
+
+def installed_backends():
+    return {backend for backend in INSTALLED_CHECKS if is_installed(backend)}
+
+def search_page(search_term, page, limit):
+    window = current_app.config['SEARCH_MAX_RESULTS']
+    start, size = page_bounds(page, limit, window)
+    backend = search_backend()
+
+    if backend == 'memory':
+        matches = current_index().search(search_term, limit=window + 1)
+        return matches[start:start + size], min(len(matches), window), len(matches) > window
+
+    lexemes = 0
+    if needs_lexemes(backend, search_term):
+        lexemes = db.session.execute(lexeme_count(search_term)).scalar()
+    selections = search_select(backend, search_term, window, installed_backends(), lexemes)
+    page_statement, count_statement = window_statements(selections, start, size, window)
+
+    found = []
+    if page_statement is not None:
+        found = [{field: row[field] for field in QUESTION_FIELDS}
+                 for row in db.session.execute(page_statement)]
+    total = db.session.execute(count_statement).scalar()
+    return found, min(total, window), total > window
@@ -0,0 +1,195 @@
+import re
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from heapq import merge
+from flask import current_app
+from models import QUESTION_COLUMNS, QUESTION_FIELDS, DataVersion, Question, on_change
+from .data_version import data_version
+from .single_flight import SingleFlight
+
+"""
+In-memory search index
+    the 'memory' SEARCH_BACKEND for read-heavy nodes. Every question is kept
+    in process together with an inverted index from the words of its text to
+    a sorted array of question ids, so searches never reach Postgres.
+
+    Matches keep the ILIKE substring semantics of search_question: each word
+    of the term selects the indexed words that contain it, their posting
+    lists are intersected, and the candidates are checked against the full
+    question text.
+
+    The index follows writes made through this process (models.on_change).
+    It keeps the data version it was built at, moved along with those
+    writes, and is rebuilt when data_version() is newer: a write made by
+    another process is seen within DATA_VERSION_TTL. POST /search/index
+    rebuilds on demand, and SEARCH_INDEX_MAX_AGE bounds the age of the
+    index for writes that do not bump the version.
+"""
+WORD = re.compile(r'\w+')
+
+def tokenize(text):
+    return WORD.findall((text or '').lower())
+
+def contains(ids, question_id):
+    position = bisect_left(ids, question_id)
+    return position < len(ids) and ids[position] == question_id
+
+def intersect(posting_lists):
+    posting_lists = sorted(posting_lists, key=len)
+    result = posting_lists[0]
+    for ids in posting_lists[1:]:
+        result = [question_id for question_id in result if contains(ids, question_id)]
+        if not result:
+            break
+    return result
+
+def union(posting_lists):
+    if len(posting_lists) == 1:
+        return posting_lists[0]
+    result = []
+    for question_id in merge(*posting_lists):
+        if not result or result[-1] != question_id:
+            result.append(question_id)
+    return result
+
+class SearchIndex:
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.questions = {}
+        self.texts = {}
+        self.postings = {}
+        self.built_at = None
+        # data version the contents match
+        self.version = None
+        self.flights = SingleFlight()
+
+    def build(self, records, version=None):
+        fresh = SearchIndex()
+        for record in records:
+            fresh.add(record)
+        with self.lock:
+            self.questions = fresh.questions
+            self.texts = fresh.texts
+            self.postings = fresh.postings
+            self.built_at = time.time()
+            self.version = version
+
+    def follow(self):
+        # a write of this process bumped the version by one; if another
+        # process wrote in between, the version read next is still newer
+        with self.lock:
+            if self.version is not None:
+                self.version += 1
+
+    def add(self, record):
+        question_id = record['id']
+        text = (record['question'] or '').lower()
+        with self.lock:
+            self.remove(question_id)
+            self.questions[question_id] = record
+            self.texts[question_id] = text
+            for word in set(tokenize(text)):
+                ids = self.postings.setdefault(word, array('i'))
+                if not ids or ids[-1] < question_id:
+                    ids.append(question_id)
+                else:
+                    insort(ids, question_id)
+
+    def remove(self, question_id):
+        with self.lock:
+            text = self.texts.pop(question_id, None)
+            if text is None:
+                return
+            del self.questions[question_id]
+            for word in set(tokenize(text)):
+                ids = self.postings[word]
+                del ids[bisect_left(ids, question_id)]
+                if not ids:
+                    del self.postings[word]
+
+    def search(self, search_term, limit=None):
+        needle = search_term.lower()
+        with self.lock:
+            words = set(tokenize(needle))
+            if words:
+                candidates = intersect([
+                    union([ids for indexed, ids in self.postings.items() if word in indexed])
+                    for word in words])
+            else:
+                candidates = sorted(self.texts)
+
+            matches = []
+            for question_id in candidates:
+                if needle in self.texts[question_id]:
+                    matches.append(self.questions[question_id])
+                    if limit is not None and len(matches) >= limit:
+                        break
+            return matches
+
+    def memory_report(self):
+        with self.lock:
+            sizes = {
+                'postings': sum(sys.getsizeof(ids) for ids in self.postings.values()),
+                'words': sum(sys.getsizeof(word) for word in self.postings),
+                'texts': sum(sys.getsizeof(text) for text in self.texts.values()),
+                'questions': sum(sys.getsizeof(record) + sum(sys.getsizeof(value) for value in record.values())
+                                 for record in self.questions.values()),
+                'tables': sum(sys.getsizeof(table) for table in (self.postings, self.texts, self.questions)),
+            }
+            sizes['total'] = sum(sizes.values())
+            return {
+                'questions': len(self.questions),
+                'words': len(self.postings),
+                'postings': sum(len(ids) for ids in self.postings.values()),
+                'builtAt': self.built_at,
+                'version': self.version,
+                'bytes': sizes,
+            }
+
+def load_questions():
+    selections = Question.query.order_by(Question.id).with_entities(*QUESTION_COLUMNS)
+    for row in selections.yield_per(1000):
+        yield dict(zip(QUESTION_FIELDS, row))
+
+def rebuild_index(index):
+    # read before the rows: a write landing during the load leaves the
+    # index older than the database, never newer
+    version = DataVersion.get()
+    index.build(load_questions(), version)
+    return index
+
+def init_search_index(app):
+    index = SearchIndex()
+    app.extensions['trivia_search_index'] = index
+    with app.app_context():
+        rebuild_index(index)
+
+    def follow_writes(table, action, record):
+        if table != Question.__tablename__:
+            index.follow()
+        elif action == 'delete':
+            index.remove(record['id'])
+            index.follow()
+        elif action == 'import':
+            # imported rows come without their ids
+            rebuild_index(index)
+        else:
+            index.add(record)
+            index.follow()
+
+    on_change(app, follow_writes)
+    return index
+
+def current_index():
+    index = current_app.extensions['trivia_search_index']
+    max_age = current_app.config['SEARCH_INDEX_MAX_AGE']
+    # a replica behind the primary reports an older version, which is no
+    # reason to rebuild
+    if data_version() > index.version or (max_age and time.time() - index.built_at > max_age):
+        # one request rebuilds, the others wait for it
+        index.flights.run('rebuild', lambda: rebuild_index(index))
+    return index
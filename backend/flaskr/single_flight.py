@@ -0,0 +1,70 @@
+import math
+import random
+import threading
+
+"""
+Single flight
+    when a cached value goes missing under load, every request that wants
+    it at the same moment would run the same query. SingleFlight.run lets
+    the first caller for a key compute it while the others wait for that
+    result instead of computing it again.
+
+    refresh_due implements probabilistic early expiration (XFetch): a value
+    that took delta seconds to compute is refreshed before its TTL is over
+    with a probability that grows as the expiry gets closer, so one request
+    renews a hot value while the others keep using the cached one, and the
+    whole load never reaches the expiry together. EARLY_REFRESH_BETA scales
+    how early; 0 refreshes only on expiry.
+"""
+def refresh_due(loaded_at, ttl, delta, beta, now):
+    # 1 - random() is in (0, 1], so the log is defined and <= 0
+    return now - delta * beta * math.log(1.0 - random.random()) >= loaded_at + ttl
+
+class Flight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.failed = False
+
+class SingleFlight:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def run(self, key, compute, wait=True):
+        """Return (True, compute()) to the caller that computes key and
+        (False, its result) to the callers that waited for it. A waiter gets
+        (False, None) when the computation raised, and does not wait at all
+        when wait is False."""
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+                self.leaders += 1
+            elif wait:
+                self.coalesced += 1
+        if not leader:
+            if not wait:
+                return False, None
+            flight.done.wait()
+            return False, None if flight.failed else flight.result
+
+        try:
+            flight.result = compute()
+        except BaseException:
+            flight.failed = True
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+        return True, flight.result
+
+    def stats(self):
+        with self.lock:
+            return {'computed': self.leaders, 'coalesced': self.coalesced, 'inFlight': len(self.flights)}
@@ -0,0 +1,41 @@
+import multiprocessing
+import os
+
+"""
+Gunicorn settings for the trivia API
+    every value can be overridden through the environment, see the
+    "Run in Production" section of the README.
+"""
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+
+# pre-fork workers, each serving requests from a small thread pool; the
+# threads overlap the time spent waiting on Postgres
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+
+# build the app (category cache, search index, secret key) once in the
+# master, workers inherit it through fork
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+# recycle workers so slow leaks cannot grow without bound; the jitter keeps
+# them from restarting all at once
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+accesslog = os.getenv('GUNICORN_ACCESSLOG', None)
+
+def post_fork(server, worker):
+    # connections opened by the master while preloading must not be shared
+    # between processes; each worker opens its own
+    if preload_app:
+        from models import db
+        from wsgi import app
+        with app.app_context():
+            db.engine.dispose()
+        if 'trivia_replicas' in app.extensions:
+            app.extensions['trivia_replicas'].dispose()
@@ -0,0 +1,46 @@
+"""categories and questions as defined in trivia.psql
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 09:00:00
+
+Databases loaded from trivia.psql already have both tables; upgrading them
+only records the revision.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing = sa.inspect(op.get_bind()).get_table_names()
+    if 'categories' not in existing:
+        op.create_table(
+            'categories',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('type', sa.String(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+        )
+    if 'questions' not in existing:
+        op.create_table(
+            'questions',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('question', sa.String(), nullable=True),
+            sa.Column('answer', sa.String(), nullable=True),
+            sa.Column('difficulty', sa.Integer(), nullable=True),
+            sa.Column('category', sa.Integer(), nullable=True),
+            sa.ForeignKeyConstraint(['category'], ['categories.id'], name='category',
+                                    onupdate='CASCADE', ondelete='SET NULL'),
+            sa.PrimaryKeyConstraint('id'),
+        )
+
+
+def downgrade():
+    op.drop_table('questions')
+    op.drop_table('categories')
@@ -0,0 +1,33 @@
+"""question_counters
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 09:01:00
+
+Counters start empty; totals fall back to counting questions until
+`flask rebuild-counters` or the first write fills them.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'question_counters' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        'question_counters',
+        sa.Column('category', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('total', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('category'),
+    )
+
+
+def downgrade():
+    op.drop_table('question_counters')
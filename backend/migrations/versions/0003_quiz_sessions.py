@@ -0,0 +1,35 @@
+"""quiz_sessions
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 09:02:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'quiz_sessions' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        'quiz_sessions',
+        sa.Column('id', sa.String(length=32), nullable=False),
+        sa.Column('category', sa.Integer(), nullable=True),
+        sa.Column('seen', sa.LargeBinary(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_quiz_sessions_updated_at', 'quiz_sessions', ['updated_at'])
+
+
+def downgrade():
+    op.drop_index('ix_quiz_sessions_updated_at', table_name='quiz_sessions')
+    op.drop_table('quiz_sessions')
@@ -0,0 +1,48 @@
+"""integer questions.category with its indexes
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 09:03:00
+
+Tables created by db.create_all before the model declared an integer
+category have a varchar column and no foreign key; both are fixed on
+Postgres. SQLite cannot change a column type, but its type affinity already
+stores the ids as integers, so it only gets the indexes.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        op.execute("""
+            DO $$ BEGIN
+                IF (SELECT data_type FROM information_schema.columns
+                    WHERE table_name = 'questions' AND column_name = 'category') <> 'integer' THEN
+                    ALTER TABLE questions ALTER COLUMN category TYPE integer
+                        USING nullif(category, '')::integer;
+                END IF;
+            END $$
+        """)
+        if not sa.inspect(bind).get_foreign_keys('questions'):
+            op.create_foreign_key('category', 'questions', 'categories', ['category'], ['id'],
+                                  onupdate='CASCADE', ondelete='SET NULL')
+
+    existing = {index['name'] for index in sa.inspect(bind).get_indexes('questions')}
+    if 'ix_questions_category_id' not in existing:
+        op.create_index('ix_questions_category_id', 'questions', ['category', 'id'])
+    if 'ix_questions_category_difficulty' not in existing:
+        op.create_index('ix_questions_category_difficulty', 'questions', ['category', 'difficulty'])
+
+
+def downgrade():
+    op.drop_index('ix_questions_category_difficulty', table_name='questions')
+    op.drop_index('ix_questions_category_id', table_name='questions')
@@ -1,54 +1,264 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
-from flask_sqlalchemy import SQLAlchemy
+import threading
+import time
+from sqlalchemy import (Column, String, Integer, LargeBinary, DateTime, ForeignKey, Index, create_engine, func,
+                        inspect, literal, select)
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.sql.expression import UpdateBase
+from flask import current_app, has_app_context, g
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
 import json
 from dotenv  import load_dotenv
 
 load_dotenv()
 database_path = os.getenv('database_path')
-db = SQLAlchemy()
+replica_paths = [path for path in os.getenv('database_replica_paths', '').split(',') if path]
+
+"""
+Read replicas
+    setup_db can be given the URLs of read replicas of the database. A route
+    that only reads calls read_from(engine) before its first query; from then
+    on the queries of its session run on that replica, while flushes and
+    UPDATE / DELETE statements still go to the primary. Without a call every
+    query runs on the primary.
+"""
+class RoutingSession(SignallingSession):
+
+    def get_bind(self, mapper=None, clause=None):
+        replica = g.get('trivia_read_replica') if has_app_context() else None
+        if replica is not None and not self._flushing and not isinstance(clause, UpdateBase):
+            return replica
+        return super().get_bind(mapper, clause)
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return sessionmaker(class_=RoutingSession, db=self, **options)
+
+def read_from(engine):
+    g.trivia_read_replica = engine
+
+def read_engine():
+    """The engine the reads of the current request run on."""
+    replica = g.get('trivia_read_replica') if has_app_context() else None
+    return replica if replica is not None else db.engine
+
+class ReplicaSet:
+    """Engines of the read replicas, handed out in turn."""
+
+    def __init__(self, engines):
+        self.engines = engines
+        self.lock = threading.Lock()
+        self.turn = 0
+        self.reads = [0] * len(engines)
+
+    def next(self):
+        with self.lock:
+            index = self.turn % len(self.engines)
+            self.turn += 1
+            self.reads[index] += 1
+        return self.engines[index]
+
+    def dispose(self):
+        for engine in self.engines:
+            engine.dispose()
+
+    def stats(self):
+        with self.lock:
+            reads = list(self.reads)
+        return [{'url': repr(engine.url), 'reads': count, 'pool': pool_stats(engine)}
+                for engine, count in zip(self.engines, reads)]
+
+db = RoutingSQLAlchemy()
 
 """
 setup_db(app)
-    binds a flask application and a SQLAlchemy service
+    binds a flask application and a SQLAlchemy service, the tables come
+    from the migrations (flaskr/schema.py); replicas defaults to
+    SQLALCHEMY_REPLICA_URIS of the app config, then to the comma separated
+    database_replica_paths environment variable
 """
-def setup_db(app, database_path=database_path):
+def setup_db(app, database_path=database_path, replicas=None):
+    if replicas is None:
+        replicas = app.config.get("SQLALCHEMY_REPLICA_URIS", replica_paths)
+    if replicas:
+        engines = [create_engine(url, **engine_options(dict(app.config, SQLALCHEMY_DATABASE_URI=url)))
+                   for url in replicas]
+        app.extensions['trivia_replicas'] = ReplicaSet(engines)
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config)
     db.app = app
-    with app.app_context():
-        db.init_app(app)
-        db.create_all()
+    db.init_app(app)
 
 """
-Question
+Connection pool
+    every worker thread checks a connection out of the engine pool for the
+    length of a request. The pool is sized by DB_POOL_SIZE (connections
+    kept open) and DB_MAX_OVERFLOW (extra connections opened under load);
+    a request waits at most DB_POOL_TIMEOUT seconds for a free connection.
+    DB_POOL_PRE_PING tests a connection before handing it out and
+    DB_POOL_RECYCLE replaces connections older than that many seconds, so
+    connections dropped by the server or a proxy are not served. SQLite
+    keeps the pool SQLAlchemy picks for it; SQLALCHEMY_ENGINE_OPTIONS in the
+    app config overrides any of these.
+"""
+POOL_DEFAULTS = {
+    'DB_POOL_SIZE': 5,
+    'DB_MAX_OVERFLOW': 10,
+    'DB_POOL_TIMEOUT': 30,
+    'DB_POOL_PRE_PING': True,
+    'DB_POOL_RECYCLE': 1800,
+}
+
+def engine_options(config):
+    options = {}
+    if not (config.get("SQLALCHEMY_DATABASE_URI") or '').startswith('sqlite'):
+        settings = dict(POOL_DEFAULTS)
+        settings.update({key: config[key] for key in POOL_DEFAULTS if key in config})
+        options = {
+            'poolclass': InstrumentedQueuePool,
+            'pool_size': settings['DB_POOL_SIZE'],
+            'max_overflow': settings['DB_MAX_OVERFLOW'],
+            'pool_timeout': settings['DB_POOL_TIMEOUT'],
+            'pool_pre_ping': settings['DB_POOL_PRE_PING'],
+            'pool_recycle': settings['DB_POOL_RECYCLE'],
+        }
+    options.update(config.get("SQLALCHEMY_ENGINE_OPTIONS") or {})
+    return options
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that counts checkouts and the ones that had to wait."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        # every connection is in use and no overflow slot is left; with
+        # max_overflow -1 (no limit) a new connection is opened instead
+        full = self.checkedin() == 0 and self._max_overflow > -1 and self.overflow() >= self._max_overflow
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            with self.stats_lock:
+                self.waits += 1
+                self.timeouts += 1
+                self.wait_seconds += time.perf_counter() - started
+            raise
+        with self.stats_lock:
+            self.checkouts += 1
+            if full:
+                self.waits += 1
+                self.wait_seconds += time.perf_counter() - started
+        return connection
+
+def pool_stats(engine):
+    pool = engine.pool
+    stats = {'poolClass': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'checkedIn': pool.checkedin(),
+            'checkedOut': pool.checkedout(),
+            'overflow': max(pool.overflow(), 0),
+            'maxOverflow': pool._max_overflow,
+            'timeout': pool.timeout(),
+        })
+    if isinstance(pool, InstrumentedQueuePool):
+        with pool.stats_lock:
+            stats.update({
+                'checkouts': pool.checkouts,
+                'waits': pool.waits,
+                'waitSeconds': round(pool.wait_seconds, 6),
+                'timeouts': pool.timeouts,
+            })
+    return stats
 
 """
+on_change(app, listener)
+    registers listener(table, action, record) with the application; it is
+    called after a Question or Category write is committed, with the row
+    as formatted before the commit. A bulk import (flaskr/bulk_import.py)
+    sends a single 'import' action whose record only holds the number of
+    rows imported.
+"""
+def on_change(app, listener):
+    app.extensions.setdefault('trivia_change_listeners', []).append(listener)
+    return listener
+
+def notify_change(table, action, record):
+    # writes outside a request go through the app bound in setup_db
+    app = current_app if has_app_context() else db.app
+    for listener in app.extensions.get('trivia_change_listeners', []):
+        listener(table, action, record)
+
+def parse_category(category):
+    # clients may send the category id as a string ("1" from a form select)
+    return None if category is None else int(category)
+
+"""
+Question
+    category is the integer foreign key of trivia.psql. (category, id) serves
+    the by-category listing, its cursor pages and the quiz sampling, and
+    also every lookup on category alone; (category, difficulty) serves
+    difficulty filters within a category.
+"""
 class Question(db.Model):
     __tablename__ = 'questions'
+    __table_args__ = (
+        Index('ix_questions_category_id', 'category', 'id'),
+        Index('ix_questions_category_difficulty', 'category', 'difficulty'),
+    )
 
     id = Column(Integer, primary_key=True)
     question = Column(String)
     answer = Column(String)
-    category = Column(String)
+    category = Column(Integer, ForeignKey('categories.id', name='category',
+                                          onupdate='CASCADE', ondelete='SET NULL'))
     difficulty = Column(Integer)
 
     def __init__(self, question, answer, category, difficulty):
         self.question = question
         self.answer = answer
-        self.category = category
+        self.category = parse_category(category)
         self.difficulty = difficulty
 
     def insert(self):
         db.session.add(self)
+        db.session.flush()
+        QuestionCounter.bump(self.category, 1)
+        DataVersion.bump()
+        record = self.format()
         db.session.commit()
+        notify_change(self.__tablename__, 'insert', record)
 
     def update(self):
+        history = inspect(self).attrs.category.history
+        db.session.flush()
+        if history.deleted and history.added:
+            QuestionCounter.bump_category(history.deleted[0], -1)
+            QuestionCounter.bump_category(history.added[0], 1)
+        DataVersion.bump()
+        record = self.format()
         db.session.commit()
+        notify_change(self.__tablename__, 'update', record)
 
     def delete(self):
         db.session.delete(self)
+        db.session.flush()
+        QuestionCounter.bump(self.category, -1)
+        DataVersion.bump()
+        record = self.format()
         db.session.commit()
+        notify_change(self.__tablename__, 'delete', record)
 
     def format(self):
         return {
@@ -59,6 +269,18 @@ class Question(db.Model):
             'difficulty': self.difficulty
             }
 
+"""
+Question rows
+    list endpoints select the columns of format() as plain tuples and zip
+    them into the same dicts, instead of building a Question instance, with
+    its identity map entry and attribute state, for every row they return.
+"""
+QUESTION_FIELDS = ('id', 'question', 'answer', 'category', 'difficulty')
+QUESTION_COLUMNS = tuple(getattr(Question, field) for field in QUESTION_FIELDS)
+
+def format_rows(query):
+    return [dict(zip(QUESTION_FIELDS, row)) for row in query.with_entities(*QUESTION_COLUMNS)]
+
 """
 Category
 
@@ -80,4 +302,158 @@ class Category(db.Model):
     # add for write testcase
     def insert(self):
         db.session.add(self)
-        db.session.commit()
\ No newline at end of file
+        db.session.flush()
+        DataVersion.bump()
+        DataVersion.bump(CATEGORY_VERSION_ID)
+        record = self.format()
+        db.session.commit()
+        notify_change(self.__tablename__, 'insert', record)
+
+"""
+QuestionCounter
+    number of questions per category, plus the overall number under
+    ALL_CATEGORIES. Rows are bumped in the same transaction as
+    Question.insert/update/delete so listings read totals with a primary
+    key lookup instead of counting the table.
+
+    The statements are built by the functions below, shared with
+    create_async_app (flaskr/asgi.py), which runs them on its own driver.
+"""
+ALL_CATEGORIES = 0
+
+def category_key(category):
+    try:
+        return int(category)
+    except (TypeError, ValueError):
+        return None
+
+def count_select(key):
+    questions = Question.__table__
+    query = select([func.count()]).select_from(questions)
+    if key != ALL_CATEGORIES:
+        query = query.where(questions.c.category == key)
+    return query
+
+def count_questions(key):
+    return db.session.execute(count_select(key)).scalar()
+
+class QuestionCounter(db.Model):
+    __tablename__ = 'question_counters'
+
+    category = Column(Integer, primary_key=True, autoincrement=False)
+    total = Column(Integer, nullable=False, default=0)
+
+    def __init__(self, category, total):
+        self.category = category
+        self.total = total
+
+    @staticmethod
+    def get_total(category=ALL_CATEGORIES):
+        key = category_key(category)
+        if key is None:
+            return 0
+        total = db.session.execute(counter_select(key)).scalar()
+        if total is None:
+            return count_questions(key)
+        return total
+
+    @staticmethod
+    def bump(category, delta):
+        QuestionCounter.bump_category(ALL_CATEGORIES, delta)
+        QuestionCounter.bump_category(category, delta)
+
+    @staticmethod
+    def bump_category(category, delta):
+        key = category_key(category)
+        if key is None:
+            return
+        if db.session.execute(counter_update(key, delta)).rowcount == 0:
+            db.session.execute(counter_seed(key))
+
+    @staticmethod
+    def rebuild():
+        QuestionCounter.query.delete()
+        totals = {}
+        for category, total in db.session.query(Question.category, func.count(Question.id)) \
+                .group_by(Question.category).all():
+            totals[category_key(category)] = total
+        db.session.add(QuestionCounter(ALL_CATEGORIES, sum(totals.values())))
+        for category in Category.query.all():
+            db.session.add(QuestionCounter(category.id, totals.get(category.id, 0)))
+        db.session.commit()
+        return QuestionCounter.query.count()
+
+def counter_select(key):
+    counters = QuestionCounter.__table__
+    return select([counters.c.total]).where(counters.c.category == key)
+
+def counter_update(key, delta):
+    counters = QuestionCounter.__table__
+    return counters.update().where(counters.c.category == key).values(total=counters.c.total + delta)
+
+def counter_seed(key):
+    # first write since the counters were created: seed the row from the
+    # table, which already includes the change of the transaction
+    return QuestionCounter.__table__.insert().from_select(
+        ['category', 'total'], select([literal(key), count_select(key).as_scalar()]))
+
+"""
+QuizSession
+    server-side state of a quiz played through /quizzes/sessions: the
+    category and the packed ids of the questions already asked
+"""
+class QuizSession(db.Model):
+    __tablename__ = 'quiz_sessions'
+
+    id = Column(String(32), primary_key=True)
+    category = Column(Integer)
+    seen = Column(LargeBinary, nullable=False)
+    updated_at = Column(DateTime, nullable=False, index=True)
+
+    def __init__(self, id, category, seen, updated_at):
+        self.id = id
+        self.category = category
+        self.seen = seen
+        self.updated_at = updated_at
+
+"""
+DataVersion
+    a row counting the writes made through the models. It is bumped in the
+    same transaction as every Question and Category write, so a response
+    built from data read after the version can be labelled with it (see
+    flaskr/data_version.py). A second row counts the Category writes alone,
+    so the category maps are not reloaded after question writes (see
+    flaskr/category_cache.py).
+"""
+DATA_VERSION_ID = 1
+CATEGORY_VERSION_ID = 2
+
+class DataVersion(db.Model):
+    __tablename__ = 'data_version'
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    version = Column(Integer, nullable=False)
+
+    def __init__(self, id, version):
+        self.id = id
+        self.version = version
+
+    @staticmethod
+    def get(row=DATA_VERSION_ID):
+        return db.session.execute(data_version_select(row)).scalar() or 0
+
+    @staticmethod
+    def bump(row=DATA_VERSION_ID):
+        if db.session.execute(data_version_update(row)).rowcount == 0:
+            db.session.execute(data_version_seed(row))
+
+def data_version_select(row=DATA_VERSION_ID):
+    table = DataVersion.__table__
+    return select([table.c.version]).where(table.c.id == row)
+
+def data_version_update(row=DATA_VERSION_ID):
+    table = DataVersion.__table__
+    return table.update().where(table.c.id == row).values(version=table.c.version + 1)
+
+def data_version_seed(row=DATA_VERSION_ID):
+    return DataVersion.__table__.insert().values(id=row, version=1)
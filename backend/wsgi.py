@@ -0,0 +1,11 @@
+from flaskr import create_app
+
+"""
+Production entry point
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The application is created once when this module is imported. With
+preload_app (see gunicorn.conf.py) that happens in the master process and
+every worker starts from the same initialized app.
+"""
+app = create_app()
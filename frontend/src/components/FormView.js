@@ -18,6 +18,10 @@ class FormView extends Component {
     $.ajax({
       url: `http://127.0.0.1:5000/categories`, //TODO: update request URL
       type: 'GET',
+      xhrFields: {
+        withCredentials: true,
+      },
+      crossDomain: true,
       success: (result) => {
         this.setState({ categories: result.categories });
         return;
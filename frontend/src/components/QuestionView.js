@@ -24,6 +24,10 @@ class QuestionView extends Component {
     $.ajax({
       url: `http://127.0.0.1:5000/questions?page=${this.state.page}`, //TODO: update request URL
       type: 'GET',
+      xhrFields: {
+        withCredentials: true,
+      },
+      crossDomain: true,
       success: (result) => {
         this.setState({
           questions: result.questions,
@@ -67,6 +71,10 @@ class QuestionView extends Component {
     $.ajax({
       url: `http://127.0.0.1:5000/categories/${id}/questions`, //TODO: update request URL
       type: 'GET',
+      xhrFields: {
+        withCredentials: true,
+      },
+      crossDomain: true,
       success: (result) => {
         this.setState({
           questions: result.questions,
@@ -114,6 +122,10 @@ class QuestionView extends Component {
         $.ajax({
           url: `http://127.0.0.1:5000/questions/${id}`, //TODO: update request URL
           type: 'DELETE',
+          xhrFields: {
+            withCredentials: true,
+          },
+          crossDomain: true,
           success: (result) => {
             this.getQuestions();
           },